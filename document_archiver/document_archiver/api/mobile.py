@@ -4,6 +4,13 @@ import base64
 import io
 from PIL import Image
 import json
+from frappe.utils import cint
+
+from document_archiver.api.response_cache import get_cached_response
+from document_archiver.doctype.document_archive.document_archive import attach_scanned_documents
+from document_archiver.encoding import encode_image, log_encoding_stats
+from document_archiver.search.fuzzy import fuzzy_search
+from document_archiver.search.index import search
 
 @frappe.whitelist()
 def mobile_scan_document(document_data):
@@ -27,7 +34,7 @@ def mobile_scan_document(document_data):
 		file_bytes = base64.b64decode(file_data)
 		
 		# Process image if needed
-		processed_file_data = process_mobile_image(file_bytes, metadata)
+		processed_file_data, file_extension = process_mobile_image(file_bytes, metadata, quality)
 		
 		# Create scanned document
 		scanned_doc = create_mobile_scanned_document(
@@ -35,7 +42,8 @@ def mobile_scan_document(document_data):
 			scanner_name=scanner_name,
 			file_data=processed_file_data,
 			quality=quality,
-			metadata=metadata
+			metadata=metadata,
+			file_extension=file_extension
 		)
 		
 		return {
@@ -50,8 +58,11 @@ def mobile_scan_document(document_data):
 		return {"status": "error", "message": str(e)}
 
 @frappe.whitelist()
-def get_document_archive_list(filters=None, limit=20, offset=0):
-	"""Get list of document archives for mobile app"""
+def get_document_archive_list(filters=None, limit=20, offset=0, cursor=None):
+	"""Get list of document archives for mobile app, newest first
+
+	Pass the returned next_cursor back as cursor to fetch the following page;
+	offset is still honoured for older clients when no cursor is given."""
 	try:
 		if filters:
 			if isinstance(filters, str):
@@ -62,64 +73,116 @@ def get_document_archive_list(filters=None, limit=20, offset=0):
 		# Add default filters
 		filters['status'] = ['!=', 'Deleted']
 		
-		archives = frappe.get_all("Document Archive",
-								filters=filters,
-								fields=["name", "title", "document_type", "status", 
-									   "created_date", "modified_date", "file_attachment"],
-								limit=limit,
-								start=offset,
-								order_by="modified_date desc")
-		
-		# Get scanned documents count for each archive
-		for archive in archives:
-			scanned_count = frappe.db.count("Scanned Document", 
-										  {"parent": archive.name})
-			archive['scanned_documents_count'] = scanned_count
-		
-		return {
-			"status": "success",
-			"archives": archives,
-			"total": len(archives)
-		}
+		return get_cached_response("archive_list",
+								   {"filters": filters, "limit": limit, "offset": offset, "cursor": cursor},
+								   lambda: build_document_archive_list(filters, cint(limit), cint(offset), cursor))
 		
 	except Exception as e:
 		frappe.log_error(f"Error getting document archive list: {str(e)}")
 		return {"status": "error", "message": str(e)}
 
+def build_document_archive_list(filters, limit, offset, cursor):
+	"""Query one page of archives with their scanned document counts"""
+	total = frappe.db.count("Document Archive", filters)
+	
+	# Keyset pagination: (modified_date, name) < cursor, which the
+	# (modified_date, name) index serves without scanning skipped rows
+	or_filters = None
+	page_filters = dict(filters)
+	if cursor:
+		modified_date, name = decode_cursor(cursor)
+		page_filters['modified_date'] = ['<=', modified_date]
+		or_filters = [["modified_date", "<", modified_date], ["name", "<", name]]
+	
+	archives = frappe.get_all("Document Archive",
+							filters=page_filters,
+							or_filters=or_filters,
+							fields=["name", "title", "document_type", "status", 
+								   "created_date", "modified_date", "file_attachment"],
+							limit=limit + 1,
+							start=0 if cursor else offset,
+							order_by="modified_date desc, name desc")
+	
+	has_more = len(archives) > limit
+	archives = archives[:limit]
+	
+	# Get scanned documents count for all archives on the page at once
+	counts = dict(frappe.get_all("Scanned Document",
+								filters={"parenttype": "Document Archive",
+										 "parent": ["in", [archive.name for archive in archives]]},
+								fields=["parent", "count(name) as count"],
+								group_by="parent",
+								as_list=True)) if archives else {}
+	
+	# First page thumbnails, so list screens never fetch full scans
+	thumbnails = dict(frappe.get_all("Scanned Document",
+									 filters={"parenttype": "Document Archive", "idx": 1,
+											  "parent": ["in", [archive.name for archive in archives]]},
+									 fields=["parent", "preview_thumbnail"],
+									 as_list=True)) if archives else {}
+	
+	for archive in archives:
+		archive['scanned_documents_count'] = counts.get(archive.name, 0)
+		archive['thumbnail_url'] = thumbnails.get(archive.name)
+	
+	return {
+		"status": "success",
+		"archives": archives,
+		"total": total,
+		"has_more": has_more,
+		"next_cursor": encode_cursor(archives[-1]) if has_more else None
+	}
+
+def encode_cursor(archive):
+	"""Opaque pagination cursor pointing after an archive"""
+	return base64.urlsafe_b64encode(json.dumps([str(archive.modified_date), archive.name]).encode()).decode()
+
+def decode_cursor(cursor):
+	"""(modified_date, name) from a cursor made by encode_cursor"""
+	modified_date, name = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+	return modified_date, name
+
 @frappe.whitelist()
 def get_document_archive_details(archive_id):
 	"""Get detailed information about a document archive"""
 	try:
-		archive = frappe.get_doc("Document Archive", archive_id)
-		
-		# Get scanned documents
-		scanned_docs = frappe.get_all("Scanned Document",
-									filters={"parent": archive_id},
-									fields=["name", "scanner_name", "scanner_type", 
-										   "scan_date", "scan_quality", "file_attachment",
-										   "processing_status", "file_size", "file_type"])
-		
-		return {
-			"status": "success",
-			"archive": {
-				"name": archive.name,
-				"title": archive.title,
-				"document_type": archive.document_type,
-				"category": archive.category,
-				"description": archive.description,
-				"tags": archive.tags,
-				"status": archive.status,
-				"created_date": archive.created_date,
-				"modified_date": archive.modified_date,
-				"file_attachment": archive.file_attachment
-			},
-			"scanned_documents": scanned_docs
-		}
+		return get_cached_response("archive_details", {"archive_id": archive_id},
+								   lambda: build_document_archive_details(archive_id), archive=archive_id)
 		
 	except Exception as e:
 		frappe.log_error(f"Error getting document archive details: {str(e)}")
 		return {"status": "error", "message": str(e)}
 
+def build_document_archive_details(archive_id):
+	"""Load an archive and its scanned documents"""
+	archive = frappe.get_doc("Document Archive", archive_id)
+	
+	# Get scanned documents
+	scanned_docs = frappe.get_all("Scanned Document",
+								filters={"parent": archive_id},
+								fields=["name", "scanner_name", "scanner_type", 
+									   "scan_date", "scan_quality", "file_attachment",
+									   "processing_status", "file_size", "file_type",
+									   "preview_thumbnail", "preview_screen", "preview_full"])
+	
+	return {
+		"status": "success",
+		"archive": {
+			"name": archive.name,
+			"title": archive.title,
+			"document_type": archive.document_type,
+			"category": archive.category,
+			"description": archive.description,
+			"tags": archive.tags,
+			"status": archive.status,
+			"created_date": archive.created_date,
+			"modified_date": archive.modified_date,
+			"file_attachment": archive.file_attachment,
+			"searchable_pdf": archive.searchable_pdf
+		},
+		"scanned_documents": scanned_docs
+	}
+
 @frappe.whitelist()
 def create_document_archive_from_mobile(archive_data):
 	"""Create a new document archive from mobile app"""
@@ -145,14 +208,16 @@ def create_document_archive_from_mobile(archive_data):
 			file_data = base64.b64decode(archive_data['file_data'])
 			metadata = archive_data.get('metadata', {})
 			
-			processed_file_data = process_mobile_image(file_data, metadata)
+			quality = archive_data.get('quality', 'High')
+			processed_file_data, file_extension = process_mobile_image(file_data, metadata, quality)
 			
 			create_mobile_scanned_document(
 				document_archive_id=archive.name,
 				scanner_name=archive_data.get('scanner_name', 'Mobile Scanner'),
 				file_data=processed_file_data,
-				quality=archive_data.get('quality', 'High'),
-				metadata=metadata
+				quality=quality,
+				metadata=metadata,
+				file_extension=file_extension
 			)
 		
 		return {
@@ -165,15 +230,14 @@ def create_document_archive_from_mobile(archive_data):
 		frappe.log_error(f"Error creating document archive from mobile: {str(e)}")
 		return {"status": "error", "message": str(e)}
 
-def process_mobile_image(file_data, metadata):
-	"""Process image from mobile app for better quality"""
+def process_mobile_image(file_data, metadata, scan_quality="High"):
+	"""Process image from mobile app and encode it for storage; returns (file data, file extension)"""
 	try:
 		# Open image
 		image = Image.open(io.BytesIO(file_data))
 		
 		# Get metadata
 		orientation = metadata.get('orientation', 1)
-		quality = metadata.get('quality', 85)
 		
 		# Handle orientation
 		if orientation in [3, 6, 8]:
@@ -188,35 +252,31 @@ def process_mobile_image(file_data, metadata):
 			new_size = tuple(int(dim * ratio) for dim in image.size)
 			image = image.resize(new_size, Image.Resampling.LANCZOS)
 		
-		# Convert to RGB if necessary
-		if image.mode != 'RGB':
-			image = image.convert('RGB')
+		# Encode with the storage profile; a quality sent by the app overrides the profile's
+		processed_data, file_extension, stats = encode_image(image, scan_quality,
+															  metadata.get('color_mode', 'Color'),
+															  metadata.get('quality'))
+		log_encoding_stats(stats, source="mobile", upload_bytes=len(file_data))
 		
-		# Save with appropriate quality
-		output = io.BytesIO()
-		image.save(output, format='JPEG', quality=quality, optimize=True)
-		
-		return output.getvalue()
+		return processed_data, file_extension
 		
 	except Exception as e:
 		frappe.log_error(f"Error processing mobile image: {str(e)}")
-		return file_data  # Return original if processing fails
+		return file_data, ".jpg"  # Return original if processing fails
 
-def create_mobile_scanned_document(document_archive_id, scanner_name, file_data, quality, metadata):
+def create_mobile_scanned_document(document_archive_id, scanner_name, file_data, quality, metadata, file_extension=".jpg"):
 	"""Create scanned document from mobile upload"""
 	try:
 		# Create file attachment
 		file_doc = frappe.get_doc({
 			"doctype": "File",
-			"file_name": f"{scanner_name}_{frappe.utils.now()}.jpg",
+			"file_name": f"{scanner_name}_{frappe.utils.now()}{file_extension}",
 			"content": file_data,
 			"is_private": 0
 		})
 		file_doc.insert()
 		
-		# Create scanned document
-		scanned_doc = frappe.get_doc({
-			"doctype": "Scanned Document",
+		row = {
 			"scanner_name": scanner_name,
 			"scanner_type": "Mobile App",
 			"scan_date": frappe.utils.today(),
@@ -224,24 +284,16 @@ def create_mobile_scanned_document(document_archive_id, scanner_name, file_data,
 			"file_attachment": file_doc.file_url,
 			"scan_quality": quality,
 			"resolution": f"{metadata.get('width', 0)}x{metadata.get('height', 0)}",
-			"color_mode": "Color",
+			"color_mode": metadata.get('color_mode', 'Color'),
 			"processing_status": "Pending"
-		})
-		
-		scanned_doc.insert()
+		}
 		
-		# Link to document archive
+		# Pages of an archive become rows of it; only loose scans stand alone
 		if document_archive_id:
-			archive_doc = frappe.get_doc("Document Archive", document_archive_id)
-			archive_doc.append("scanned_documents", {
-				"scanner_name": scanner_name,
-				"scanner_type": "Mobile App",
-				"scan_date": frappe.utils.today(),
-				"file_attachment": file_doc.file_url,
-				"scan_quality": quality,
-				"resolution": f"{metadata.get('width', 0)}x{metadata.get('height', 0)}"
-			})
-			archive_doc.save()
+			return attach_scanned_documents(document_archive_id, [row])[0]
+		
+		scanned_doc = frappe.get_doc(dict(row, doctype="Scanned Document"))
+		scanned_doc.insert()
 		
 		return scanned_doc
 		
@@ -250,35 +302,46 @@ def create_mobile_scanned_document(document_archive_id, scanner_name, file_data,
 		raise
 
 @frappe.whitelist()
-def search_documents(query, limit=20):
-	"""Search documents by text content (OCR)"""
+def search_documents(query, limit=20, start=0, mode="exact"):
+	"""Search documents by text content (OCR); mode "fuzzy" tolerates OCR errors"""
 	try:
+		limit = cint(limit)
+		start = cint(start)
+		
 		# Search in OCR text
+		scanned_hits, more_scanned = search_index("Scanned Document", query, limit, start, mode)
 		scanned_docs = frappe.db.sql("""
 			SELECT sd.name, sd.parent, sd.ocr_text, da.title, da.document_type
 			FROM `tabScanned Document` sd
 			JOIN `tabDocument Archive` da ON sd.parent = da.name
-			WHERE sd.ocr_text LIKE %s
-			AND da.status != 'Deleted'
-			ORDER BY sd.modified DESC
-			LIMIT %s
-		""", (f"%{query}%", limit), as_dict=True)
+			WHERE sd.name IN %s
+		""", (tuple(scanned_hits),), as_dict=True) if scanned_hits else []
 		
-		# Search in document titles and descriptions
+		# Search in document titles, tags and descriptions
+		archive_hits, more_archives = search_index("Document Archive", query, limit, start, mode)
 		archives = frappe.get_all("Document Archive",
-								filters=[
-									["title", "like", f"%{query}%"],
-									["status", "!=", "Deleted"]
-								],
-								fields=["name", "title", "document_type", "description"],
-								limit=limit)
+								filters={"name": ["in", list(archive_hits)]},
+								fields=["name", "title", "document_type", "description"]) if archive_hits else []
 		
 		return {
 			"status": "success",
-			"scanned_documents": scanned_docs,
-			"archives": archives
+			"scanned_documents": sort_by_score(scanned_docs, scanned_hits),
+			"archives": sort_by_score(archives, archive_hits),
+			"has_more": more_scanned or more_archives
 		}
 		
 	except Exception as e:
 		frappe.log_error(f"Error searching documents: {str(e)}")
-		return {"status": "error", "message": str(e)}
\ No newline at end of file
+		return {"status": "error", "message": str(e)}
+
+def search_index(reference_doctype, query, limit, start, mode="exact"):
+	"""Return {name: score} of ranked index hits and whether more pages exist"""
+	search_method = fuzzy_search if mode == "fuzzy" else search
+	hits, has_more = search_method(query, reference_doctype, limit=limit, start=start)
+	return {hit.name: hit.score for hit in hits}, has_more
+
+def sort_by_score(records, scores):
+	"""Order records by their search score, highest first"""
+	for record in records:
+		record['score'] = scores[record.name]
+	return sorted(records, key=lambda record: record['score'], reverse=True)
\ No newline at end of file
@@ -0,0 +1,90 @@
+import frappe
+import hashlib
+import json
+import redis
+
+from document_archiver.config import PERFORMANCE_CONFIG
+
+# Read-through cache for the mobile read endpoints. Responses are stored per
+# endpoint, user and arguments under a generation number: "list" for archive
+# lists and one per archive for its details. Invalidating bumps the
+# generation, so stale entries are never read again and simply expire.
+#
+# The counters are plain redis integers under keys already passed through
+# make_key, so they are read with the raw client: RedisWrapper's own hget
+# and hgetall would prefix the key again and try to unpickle the values.
+
+CACHE_PREFIX = "document_archiver:api"
+GENERATIONS_KEY = f"{CACHE_PREFIX}:generations"
+STATS_KEY = f"{CACHE_PREFIX}:stats"
+
+LIST_GENERATION = "list"
+
+def get_cached_response(endpoint, args, build, archive=None):
+	"""Return build() from the cache, computing and storing it on a miss"""
+	if not PERFORMANCE_CONFIG['enable_caching']:
+		return build()
+
+	cache = frappe.cache()
+	key = get_response_key(endpoint, args, archive or LIST_GENERATION)
+	response = cache.get_value(key)
+	cache.hincrby(cache.make_key(STATS_KEY), f"{endpoint}:{'hits' if response is not None else 'misses'}", 1)
+
+	if response is None:
+		response = build()
+		# Errors are not cached so the next call retries
+		if response.get("status") == "success":
+			cache.set_value(key, response, expires_in_sec=PERFORMANCE_CONFIG['cache_ttl'])
+	return response
+
+def get_response_key(endpoint, args, generation_name):
+	"""Cache key for a response under the current generation"""
+	cache = frappe.cache()
+	generation = redis.Redis.hget(cache, cache.make_key(GENERATIONS_KEY), generation_name) or 0
+	args_hash = hashlib.sha256(json.dumps(args, sort_keys=True, default=str).encode()).hexdigest()[:16]
+	return f"{CACHE_PREFIX}:{endpoint}:{int(generation)}:{frappe.session.user}:{args_hash}"
+
+def invalidate_archive(archive, lists=True):
+	"""Drop cached details of an archive and, unless lists is False, all cached lists"""
+	cache = frappe.cache()
+	key = cache.make_key(GENERATIONS_KEY)
+	if archive:
+		cache.hincrby(key, archive, 1)
+	if lists:
+		cache.hincrby(key, LIST_GENERATION, 1)
+
+def invalidate_for_doc(doc, method=None, *args):
+	"""doc_events handler for Document Archive and Scanned Document"""
+	if doc.doctype == "Document Archive":
+		invalidate_archive(doc.name)
+		if method == "after_rename" and args:
+			# after_rename also passes (old, new, merge); details cached under the old name are stale
+			invalidate_archive(args[0], lists=False)
+	elif doc.get("parenttype") == "Document Archive":
+		invalidate_archive(doc.parent)
+
+@frappe.whitelist()
+def get_response_cache_stats():
+	"""Get hit/miss counters of the mobile response cache per endpoint"""
+	try:
+		cache = frappe.cache()
+		counters = {field.decode(): int(value) for field, value in redis.Redis.hgetall(cache, cache.make_key(STATS_KEY)).items()}
+
+		endpoints = {}
+		for field, value in counters.items():
+			endpoint, counter = field.rsplit(":", 1)
+			endpoints.setdefault(endpoint, {"hits": 0, "misses": 0})[counter] = value
+
+		for stats in endpoints.values():
+			requests = stats["hits"] + stats["misses"]
+			stats["hit_rate"] = stats["hits"] / requests if requests else 0
+
+		return {
+			"status": "success",
+			"enabled": PERFORMANCE_CONFIG['enable_caching'],
+			"endpoints": endpoints
+		}
+
+	except Exception as e:
+		frappe.log_error(f"Error getting response cache stats: {str(e)}")
+		return {"status": "error", "message": str(e)}
\ No newline at end of file
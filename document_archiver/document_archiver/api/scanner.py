@@ -1,37 +1,39 @@
 import frappe
 from frappe import _
+from frappe.utils import cint
 import base64
 import io
+import json
 import os
+import signal
 import subprocess
 import tempfile
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from PIL import Image
 import cv2
 import numpy as np
 
+from document_archiver.config import FILE_PROCESSING, PERFORMANCE_CONFIG, SCANNER_CONFIG
+from document_archiver.doctype.document_archive.document_archive import attach_scanned_documents
+from document_archiver.encoding import encode_image, log_encoding_stats
+from document_archiver.ocr.preprocess import build_capture_pipeline, get_preprocess_settings, run_pipeline
+from document_archiver.scanner_health import get_scanner_health
+from document_archiver.webcam import capture_best_frame, is_session_open
+
 @frappe.whitelist()
 def scan_with_webcam(document_archive_id=None, quality="High"):
 	"""Scan document using webcam"""
 	try:
-		import cv2
-		
-		# Initialize webcam
-		cap = cv2.VideoCapture(0)
-		if not cap.isOpened():
-			return {"status": "error", "message": "Webcam not accessible"}
-		
-		# Capture image
-		ret, frame = cap.read()
-		cap.release()
-		
-		if not ret:
-			return {"status": "error", "message": "Failed to capture image"}
+		# Sharpest recent frame from the worker's open capture session
+		frame = capture_best_frame()
 		
 		# Process image based on quality
 		processed_frame = process_webcam_image(frame, quality)
 		
 		# Save image
-		image_data = save_scanned_image(processed_frame, "webcam_scan")
+		image_data, file_extension = save_scanned_image(processed_frame, "webcam_scan", quality, "Color")
 		
 		# Create scanned document record
 		scanned_doc = create_scanned_document(
@@ -39,7 +41,9 @@ def scan_with_webcam(document_archive_id=None, quality="High"):
 			scanner_name="Webcam",
 			scanner_type="Webcam",
 			file_data=image_data,
-			scan_quality=quality
+			scan_quality=quality,
+			color_mode="Color",
+			file_extension=file_extension
 		)
 		
 		return {
@@ -62,44 +66,27 @@ def scan_with_sane(document_archive_id=None, scanner_config_id=None, quality="Hi
 			config = frappe.get_doc("Scanner Config", scanner_config_id)
 			device_id = config.device_id or "default"
 			resolution = config.default_resolution or 300
+			color_mode = config.default_color_mode or "Color"
 		else:
 			device_id = "default"
 			resolution = 300
+			color_mode = "Color"
 		
-		# Create temporary file for scan
-		with tempfile.NamedTemporaryFile(suffix='.png', delete=False) as temp_file:
-			temp_path = temp_file.name
-		
-		# Run scanimage command
-		cmd = [
-			'scanimage',
-			'-d', device_id,
-			'--resolution', str(resolution),
-			'--format', 'png',
-			'--output-file', temp_path
-		]
-		
-		result = subprocess.run(cmd, capture_output=True, text=True, timeout=60)
-		
-		if result.returncode != 0:
-			os.unlink(temp_path)
-			return {"status": "error", "message": f"SANE scan failed: {result.stderr}"}
-		
-		# Read scanned image
-		with open(temp_path, 'rb') as f:
-			image_data = f.read()
-		
-		# Clean up temporary file
-		os.unlink(temp_path)
+		# Read the frame straight off scanimage's stdout and encode it into
+		# its final location, with no temporary file or extra in-memory copy
+		image = capture_sane_page(device_id, resolution, SCANNER_CONFIG['sane']['timeout'])
+		file_url, encode_stats = save_image_to_files(image, "sane_scan", quality, color_mode)
+		log_encoding_stats(encode_stats, source="sane_scan")
 		
 		# Create scanned document record
 		scanned_doc = create_scanned_document(
 			document_archive_id=document_archive_id,
 			scanner_name=f"SANE Scanner ({device_id})",
 			scanner_type="SANE",
-			file_data=image_data,
 			scan_quality=quality,
-			resolution=f"{resolution} DPI"
+			resolution=f"{resolution} DPI",
+			color_mode=color_mode,
+			file_url=file_url
 		)
 		
 		return {
@@ -117,6 +104,234 @@ def scan_with_sane(document_archive_id=None, scanner_config_id=None, quality="Hi
 		frappe.log_error(f"Error in SANE scanning: {str(e)}")
 		return {"status": "error", "message": str(e)}
 
+def capture_sane_page(device_id, resolution, timeout):
+	"""Run scanimage and read the PNM frame it writes to stdout into a numpy buffer"""
+	cmd = [
+		'scanimage',
+		'-d', device_id,
+		'--resolution', str(resolution),
+		'--format', 'pnm'
+	]
+	process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+	timer = threading.Timer(timeout, process.kill)
+	timer.start()
+	try:
+		try:
+			image = read_pnm(process.stdout)
+		except ValueError:
+			image = None
+		error = process.stderr.read().decode(errors="replace")
+		process.wait()
+	finally:
+		timer.cancel()
+	
+	if process.returncode == -signal.SIGKILL:
+		raise subprocess.TimeoutExpired(cmd, timeout)
+	if process.returncode != 0 or image is None:
+		raise RuntimeError(f"SANE scan failed: {error}")
+	return image
+
+def read_pnm_token(stream):
+	"""Next whitespace separated token of a PNM header, skipping comments"""
+	token = b""
+	while True:
+		char = stream.read(1)
+		if not char:
+			raise ValueError("Truncated PNM header")
+		if char == b"#":
+			stream.readline()
+		elif char.isspace():
+			if token:
+				return token
+		else:
+			token += char
+
+def read_pnm(stream):
+	"""Read one binary PNM image (P4, P5 or P6) from a stream into an RGB or grayscale array"""
+	magic = read_pnm_token(stream)
+	if magic not in (b"P4", b"P5", b"P6"):
+		raise ValueError(f"Unsupported PNM format {magic!r}")
+	
+	width, height = int(read_pnm_token(stream)), int(read_pnm_token(stream))
+	maxval = 1 if magic == b"P4" else int(read_pnm_token(stream))
+	
+	if magic == b"P4":
+		shape = (height, (width + 7) // 8)
+	elif magic == b"P5":
+		shape = (height, width)
+	else:
+		shape = (height, width, 3)
+	image = np.empty(shape, dtype='>u2' if maxval > 255 else np.uint8)
+	
+	# Fill the array in place; the frame never exists as a bytes object
+	buffer = memoryview(image.view(np.uint8).reshape(-1))
+	filled = 0
+	while filled < len(buffer):
+		read = stream.readinto(buffer[filled:])
+		if not read:
+			raise ValueError("Truncated PNM data")
+		filled += read
+	
+	if magic == b"P4":
+		# Bitmap rows are packed, with 1 meaning black
+		return (np.unpackbits(image, axis=1)[:, :width] ^ 1) * 255
+	if maxval > 255:
+		image = image.astype(np.uint16)
+	return image
+
+def save_image_to_files(image, prefix, scan_quality=None, color_mode=None, files_path=None):
+	"""Encode an image with its storage profile directly into the public files folder
+
+	Returns the file URL and the encode stats. Pass files_path when calling
+	from a thread, where the site context is not available."""
+	data, extension, stats = encode_image(image, scan_quality, color_mode)
+	file_name = f"{prefix}_{frappe.generate_hash(length=10)}{extension}"
+	with open(os.path.join(files_path or frappe.get_site_path("public", "files"), file_name), 'wb') as f:
+		f.write(data)
+	return f"/files/{file_name}", stats
+
+def register_file(file_url):
+	"""Insert the File record for a file already written under /files"""
+	file_doc = frappe.get_doc({
+		"doctype": "File",
+		"file_name": os.path.basename(file_url),
+		"file_url": file_url,
+		"is_private": 0
+	})
+	file_doc.insert()
+	return file_doc
+
+@frappe.whitelist()
+def scan_batch_with_sane(document_archive_id, scanner_config_id=None, quality="High", source="ADF"):
+	"""Scan every page in the document feeder into an archive, in the background"""
+	try:
+		frappe.get_doc("Document Archive", document_archive_id).check_permission("write")
+		
+		frappe.enqueue(
+			"document_archiver.api.scanner.run_sane_batch_scan",
+			queue="long",
+			timeout=SCANNER_CONFIG['sane']['batch_timeout'],
+			document_archive_id=document_archive_id,
+			scanner_config_id=scanner_config_id,
+			quality=quality,
+			source=source,
+			user=frappe.session.user
+		)
+		
+		return {"status": "success", "message": "Batch scan started"}
+		
+	except Exception as e:
+		frappe.log_error(f"Error starting SANE batch scan: {str(e)}")
+		return {"status": "error", "message": str(e)}
+
+def run_sane_batch_scan(document_archive_id, scanner_config_id=None, quality="High", source="ADF", user=None):
+	"""Background job: capture, encode and queue OCR for feeder pages as they arrive"""
+	if scanner_config_id:
+		config = frappe.get_doc("Scanner Config", scanner_config_id)
+		device_id = config.device_id or "default"
+		resolution = config.default_resolution or 300
+		color_mode = config.default_color_mode or "Color"
+	else:
+		device_id = "default"
+		resolution = 300
+		color_mode = "Color"
+	
+	scanner_name = f"SANE Scanner ({device_id})"
+	files_path = frappe.get_site_path("public", "files")
+	batch_size = PERFORMANCE_CONFIG['batch_processing_size']
+	pages = 0
+	
+	with tempfile.TemporaryDirectory() as temp_dir:
+		# scanimage prints each page's file name once the page is fully written.
+		# Raw PNM is the cheapest format for it to write; storage encoding
+		# happens on a thread pool while the feeder keeps going.
+		cmd = [
+			'scanimage',
+			'-d', device_id,
+			'--resolution', str(resolution),
+			'--source', source,
+			'--format', 'pnm',
+			f'--batch={os.path.join(temp_dir, "page-%04d.pnm")}',
+			'--batch-print'
+		]
+		process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+		
+		with ThreadPoolExecutor(max_workers=PERFORMANCE_CONFIG['max_workers']) as executor:
+			encoding = deque()
+			
+			def attach_encoded(wait_for):
+				"""Attach encoded pages in feeder order, one chunk of rows at a time"""
+				nonlocal pages
+				ready = []
+				taken = 0
+				while encoding and (taken < wait_for or encoding[0].done()):
+					taken += 1
+					try:
+						file_url, encode_stats = encoding.popleft().result()
+					except Exception as e:
+						frappe.log_error(f"Error encoding scanned page: {str(e)}")
+						continue
+					log_encoding_stats(encode_stats, source="sane_batch", archive=document_archive_id)
+					ready.append(file_url)
+				
+				for start in range(0, len(ready), batch_size):
+					chunk = ready[start:start + batch_size]
+					attach_scanned_pages(document_archive_id, scanner_name, "SANE", chunk, quality,
+										 f"{resolution} DPI", color_mode)
+					# Commit so this chunk's OCR jobs start while scanning continues
+					frappe.db.commit()
+					pages += len(chunk)
+					frappe.publish_realtime("document_archiver_batch_scan",
+											{"archive": document_archive_id, "pages": pages}, user=user)
+			
+			for line in process.stdout:
+				page_path = line.strip()
+				if page_path:
+					encoding.append(executor.submit(encode_scanned_page, page_path, files_path, quality, color_mode))
+				if len(encoding) >= batch_size:
+					attach_encoded(batch_size)
+			
+			process.wait()
+			attach_encoded(len(encoding))
+		
+		# Exit status 7 means the feeder ran out of paper
+		if process.returncode not in (0, 7) or not pages:
+			error = process.stderr.read()
+			frappe.log_error(f"SANE batch scan of {document_archive_id} stopped after {pages} pages: {error}")
+	
+	frappe.publish_realtime("document_archiver_batch_scan",
+							{"archive": document_archive_id, "pages": pages, "done": True}, user=user)
+	return pages
+
+def encode_scanned_page(page_path, files_path, scan_quality, color_mode):
+	"""Encode a raw PNM page from scanimage into the files folder and remove the raw file"""
+	try:
+		with Image.open(page_path) as image:
+			image.load()
+			return save_image_to_files(image, "sane_batch", scan_quality, color_mode, files_path)
+	finally:
+		os.unlink(page_path)
+
+def attach_scanned_pages(document_archive_id, scanner_name, scanner_type, file_urls, scan_quality,
+						 resolution=None, color_mode=None):
+	"""Register pages already stored under /files and add them to an archive as new rows"""
+	rows = []
+	for file_url in file_urls:
+		file_doc = register_file(file_url)
+		
+		rows.append({
+			"scanner_name": scanner_name,
+			"scanner_type": scanner_type,
+			"scan_date": frappe.utils.today(),
+			"scan_time": frappe.utils.now_time(),
+			"file_attachment": file_doc.file_url,
+			"scan_quality": scan_quality,
+			"resolution": resolution,
+			"color_mode": color_mode
+		})
+	
+	return attach_scanned_documents(document_archive_id, rows)
+
 @frappe.whitelist()
 def scan_with_twain(document_archive_id=None, scanner_config_id=None, quality="High"):
 	"""Scan document using TWAIN (Windows only)"""
@@ -168,64 +383,107 @@ def upload_scanned_document(document_archive_id=None, file_data=None, scanner_na
 		frappe.log_error(f"Error uploading scanned document: {str(e)}")
 		return {"status": "error", "message": str(e)}
 
-def process_webcam_image(frame, quality):
-	"""Process webcam image for better quality"""
+@frappe.whitelist()
+def upload_scanned_pages(document_archive_id, pages, scanner_name="File Upload", quality="High"):
+	"""Add several pages to one archive as new rows"""
 	try:
-		# Convert BGR to RGB
-		rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-		
-		# Apply image enhancement based on quality
-		if quality == "Maximum":
-			# Apply denoising
-			rgb_frame = cv2.fastNlMeansDenoisingColored(rgb_frame, None, 10, 10, 7, 21)
+		if isinstance(pages, str):
+			pages = json.loads(pages)
+		if not pages:
+			return {"status": "error", "message": "No pages provided"}
+		
+		frappe.has_permission("Document Archive", "write", document_archive_id, throw=True)
+		
+		file_urls = []
+		for page in pages:
+			if page.get('file_url'):
+				# Only files the caller can already read may be attached by URL
+				file_name = frappe.db.get_value("File", {"file_url": page['file_url']}, "name")
+				if not file_name or not frappe.has_permission("File", "read", frappe.get_doc("File", file_name)):
+					frappe.throw(_("File {0} not found or not permitted").format(page['file_url']), frappe.PermissionError)
+				file_urls.append(page['file_url'])
+				continue
+			
+			# Reject oversized pages before decoding them
+			if len(page.get('file_data') or "") * 3 // 4 > FILE_PROCESSING['max_file_size']:
+				frappe.throw(_("Page {0} exceeds the allowed file size").format(len(file_urls) + 1))
 			
-			# Apply sharpening
-			kernel = np.array([[-1,-1,-1], [-1,9,-1], [-1,-1,-1]])
-			rgb_frame = cv2.filter2D(rgb_frame, -1, kernel)
+			file_doc = frappe.get_doc({
+				"doctype": "File",
+				"file_name": page.get('file_name') or f"{scanner_name}_{frappe.utils.now()}_{len(file_urls) + 1}.png",
+				"content": base64.b64decode(page['file_data']),
+				"is_private": 0
+			})
+			file_doc.insert()
+			file_urls.append(file_doc.file_url)
+		
+		rows = []
+		for page, file_url in zip(pages, file_urls):
+			rows.append({
+				"scanner_name": scanner_name,
+				"scanner_type": "Mobile App",
+				"scan_date": frappe.utils.today(),
+				"scan_time": frappe.utils.now_time(),
+				"file_attachment": file_url,
+				"scan_quality": quality,
+				"resolution": page.get('resolution')
+			})
+		
+		# The new rows are inserted alone and their OCR is queued in batches
+		scanned_docs = attach_scanned_documents(document_archive_id, rows)
+		
+		return {
+			"status": "success",
+			"message": f"{len(file_urls)} pages uploaded successfully",
+			"scanned_document_ids": [doc.name for doc in scanned_docs],
+			"file_urls": file_urls
+		}
 		
-		return rgb_frame
+	except Exception as e:
+		frappe.db.rollback()
+		frappe.log_error(f"Error uploading scanned pages: {str(e)}")
+		return {"status": "error", "message": str(e)}
+
+def process_webcam_image(frame, quality):
+	"""Process webcam image for better quality"""
+	try:
+		settings = get_preprocess_settings(quality)
+		return run_pipeline(frame, build_capture_pipeline(settings), settings)
 		
 	except Exception as e:
 		frappe.log_error(f"Error processing webcam image: {str(e)}")
 		return frame
 
-def save_scanned_image(image_data, filename_prefix):
-	"""Save scanned image and return file data"""
+def save_scanned_image(image_data, filename_prefix, scan_quality=None, color_mode=None):
+	"""Encode a scanned image with its storage profile and return (file data, file extension)"""
 	try:
-		# Convert image to bytes
-		if isinstance(image_data, np.ndarray):
-			# Convert numpy array to PIL Image
-			pil_image = Image.fromarray(image_data)
-		else:
-			pil_image = image_data
-        
-		# Convert to bytes
-		img_buffer = io.BytesIO()
-		pil_image.save(img_buffer, format='PNG')
-		file_data = img_buffer.getvalue()
+		file_data, file_extension, stats = encode_image(image_data, scan_quality, color_mode)
+		log_encoding_stats(stats, source=filename_prefix)
 		
-		return file_data
+		return file_data, file_extension
 		
 	except Exception as e:
 		frappe.log_error(f"Error saving scanned image: {str(e)}")
 		raise
 
 def create_scanned_document(document_archive_id=None, scanner_name="Unknown", scanner_type="Unknown", 
-						   file_data=None, scan_quality="High", resolution=None):
-	"""Create a new Scanned Document record"""
+						   file_data=None, scan_quality="High", resolution=None, file_url=None,
+						   color_mode=None, file_extension=".png"):
+	"""Create a new Scanned Document record from file bytes or a file already under /files"""
 	try:
 		# Create file attachment
-		file_doc = frappe.get_doc({
-			"doctype": "File",
-			"file_name": f"{scanner_name}_{frappe.utils.now()}.png",
-			"content": file_data,
-			"is_private": 0
-		})
-		file_doc.insert()
+		if file_url:
+			file_doc = register_file(file_url)
+		else:
+			file_doc = frappe.get_doc({
+				"doctype": "File",
+				"file_name": f"{scanner_name}_{frappe.utils.now()}{file_extension}",
+				"content": file_data,
+				"is_private": 0
+			})
+			file_doc.insert()
 		
-		# Create scanned document
-		scanned_doc = frappe.get_doc({
-			"doctype": "Scanned Document",
+		row = {
 			"scanner_name": scanner_name,
 			"scanner_type": scanner_type,
 			"scan_date": frappe.utils.today(),
@@ -233,23 +491,16 @@ def create_scanned_document(document_archive_id=None, scanner_name="Unknown", sc
 			"file_attachment": file_doc.file_url,
 			"scan_quality": scan_quality,
 			"resolution": resolution,
+			"color_mode": color_mode,
 			"processing_status": "Pending"
-		})
-		
-		scanned_doc.insert()
+		}
 		
-		# Link to document archive if provided
+		# Pages of an archive become rows of it; only loose scans stand alone
 		if document_archive_id:
-			archive_doc = frappe.get_doc("Document Archive", document_archive_id)
-			archive_doc.append("scanned_documents", {
-				"scanner_name": scanner_name,
-				"scanner_type": scanner_type,
-				"scan_date": frappe.utils.today(),
-				"file_attachment": file_doc.file_url,
-				"scan_quality": scan_quality,
-				"resolution": resolution
-			})
-			archive_doc.save()
+			return attach_scanned_documents(document_archive_id, [row])[0]
+		
+		scanned_doc = frappe.get_doc(dict(row, doctype="Scanned Document"))
+		scanned_doc.insert()
 		
 		return scanned_doc
 		
@@ -258,22 +509,27 @@ def create_scanned_document(document_archive_id=None, scanner_name="Unknown", sc
 		raise
 
 @frappe.whitelist()
-def get_scanner_status():
-	"""Get status of all configured scanners"""
+def get_scanner_status(refresh=False):
+	"""Get last known status of all configured scanners from the health cache"""
 	try:
 		scanners = frappe.get_all("Scanner Config", 
 								 filters={"is_active": 1},
 								 fields=["name", "scanner_name", "scanner_type", "device_id"])
 		
+		if cint(refresh):
+			frappe.enqueue("document_archiver.scanner_health.refresh_scanner_health", queue="short", force=True)
+		health = get_scanner_health()
+		
 		status_list = []
 		for scanner in scanners:
-			status = test_scanner_connection(scanner.name)
+			status = health.get(scanner.name, {"status": "unknown", "message": "Not checked yet"})
 			status_list.append({
 				"scanner_name": scanner.scanner_name,
 				"scanner_type": scanner.scanner_type,
 				"device_id": scanner.device_id,
 				"status": status.get("status", "unknown"),
-				"message": status.get("message", "")
+				"message": status.get("message", ""),
+				"checked_at": status.get("checked_at")
 			})
 		
 		return {"status": "success", "scanners": status_list}
@@ -300,12 +556,12 @@ def test_scanner_connection(scanner_config_id):
 		frappe.log_error(f"Error testing scanner connection: {str(e)}")
 		return {"status": "error", "message": str(e)}
 
-def test_sane_scanner(config):
+def test_sane_scanner(config, timeout=30):
 	"""Test SANE scanner connection"""
 	try:
 		device_id = config.device_id or "default"
 		result = subprocess.run(['scanimage', '-d', device_id, '--test'], 
-							  capture_output=True, text=True, timeout=30)
+							  capture_output=True, text=True, timeout=timeout)
 		
 		if result.returncode == 0:
 			return {"status": "success", "message": "SANE scanner connection successful"}
@@ -314,9 +570,15 @@ def test_sane_scanner(config):
 	except Exception as e:
 		return {"status": "error", "message": f"SANE test error: {str(e)}"}
 
-def test_webcam_scanner(config):
-	"""Test webcam connection"""
+def test_webcam_scanner(config, session_open=None):
+	"""Test webcam connection; session_open is passed in by callers off the request thread"""
 	try:
+		if session_open is None:
+			session_open = is_session_open()
+		# An open capture session, here or in another worker, holds the device and is the proof
+		if session_open:
+			return {"status": "success", "message": "Webcam connection successful"}
+		
 		import cv2
 		cap = cv2.VideoCapture(0)
 		if cap.isOpened():
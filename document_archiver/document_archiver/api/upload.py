@@ -0,0 +1,179 @@
+import frappe
+from frappe import _
+from frappe.utils import cint
+import os
+import time
+
+from document_archiver.api.scanner import create_scanned_document
+from document_archiver.config import API_CONFIG, FILE_PROCESSING
+from document_archiver.ocr.cache import hash_file
+
+# Resumable uploads. A client calls init_upload with the file size and its
+# SHA-256, PUTs the raw bytes to upload_chunk in pieces (each tagged with
+# its byte offset), asks get_upload_status where to resume after a dropped
+# connection, and calls finalize_upload once every byte has arrived. Chunks
+# go straight to a partial file under the site's private folder, so memory
+# use is bounded by the chunk size rather than the file size.
+
+SESSION_PREFIX = "document_archiver:upload"
+
+@frappe.whitelist()
+def init_upload(file_name, file_size, checksum, document_archive_id=None, scanner_name="File Upload", quality="High"):
+	"""Start a resumable upload and return its id and the accepted chunk size"""
+	try:
+		file_size = cint(file_size)
+		extension = os.path.splitext(file_name)[1].lower()
+
+		if extension not in FILE_PROCESSING['supported_formats']:
+			return {"status": "error", "message": f"Unsupported file format: {extension}"}
+		if not 0 < file_size <= FILE_PROCESSING['max_file_size']:
+			return {"status": "error", "message": "File size exceeds the allowed maximum"}
+		if document_archive_id and not frappe.has_permission("Document Archive", "write", document_archive_id):
+			return {"status": "error", "message": "Not permitted to add pages to this archive"}
+
+		upload_id = frappe.generate_hash(length=20)
+		session = {
+			"upload_id": upload_id,
+			"owner": frappe.session.user,
+			"file_name": os.path.basename(file_name),
+			"file_size": file_size,
+			"checksum": checksum.lower(),
+			"document_archive_id": document_archive_id,
+			"scanner_name": scanner_name,
+			"quality": quality,
+		}
+		open(get_part_path(upload_id), 'wb').close()
+		save_session(session)
+
+		return {
+			"status": "success",
+			"upload_id": upload_id,
+			"chunk_size": API_CONFIG['upload_chunk_size']
+		}
+
+	except Exception as e:
+		frappe.log_error(f"Error starting upload: {str(e)}")
+		return {"status": "error", "message": str(e)}
+
+@frappe.whitelist()
+def upload_chunk(upload_id, offset):
+	"""Write the raw request body of a PUT at the given byte offset"""
+	try:
+		session = get_session(upload_id)
+		offset = cint(offset)
+		path = get_part_path(upload_id)
+		received = os.path.getsize(path)
+
+		# A chunk may be resent after a lost response, but never skip ahead
+		if offset < 0 or offset > received:
+			return {"status": "error", "message": "Chunk offset does not match the upload", "offset": received}
+
+		# Frappe has already buffered the body, so its size is checked before it is used.
+		# Chunked transfer encoding has no Content-Length and is refused
+		length = frappe.request.content_length
+		if length is None:
+			return {"status": "error", "message": "Chunks must be sent with a Content-Length", "offset": received}
+		if length > API_CONFIG['upload_chunk_size']:
+			return {"status": "error", "message": "Chunk exceeds the allowed chunk size", "offset": received}
+		if offset + length > session['file_size']:
+			return {"status": "error", "message": "Chunk extends past the declared file size", "offset": received}
+
+		data = frappe.request.get_data()
+		if len(data) != length:
+			return {"status": "error", "message": "Chunk is shorter than its Content-Length", "offset": received}
+
+		with open(path, 'r+b') as f:
+			f.seek(offset)
+			f.write(data)
+			f.truncate()
+
+		save_session(session)
+		return {"status": "success", "offset": offset + len(data)}
+
+	except Exception as e:
+		frappe.log_error(f"Error receiving upload chunk: {str(e)}")
+		return {"status": "error", "message": str(e)}
+
+@frappe.whitelist()
+def get_upload_status(upload_id):
+	"""Bytes received so far, i.e. the offset to resume from"""
+	try:
+		session = get_session(upload_id)
+		return {
+			"status": "success",
+			"offset": os.path.getsize(get_part_path(upload_id)),
+			"file_size": session['file_size']
+		}
+
+	except Exception as e:
+		return {"status": "error", "message": str(e)}
+
+@frappe.whitelist()
+def finalize_upload(upload_id):
+	"""Verify a completed upload and create its Scanned Document"""
+	try:
+		session = get_session(upload_id)
+		path = get_part_path(upload_id)
+
+		if os.path.getsize(path) != session['file_size']:
+			return {"status": "error", "message": "Upload is incomplete", "offset": os.path.getsize(path)}
+		if hash_file(path) != session['checksum']:
+			# Start over: the received bytes cannot be trusted
+			open(path, 'wb').close()
+			return {"status": "error", "message": "Checksum mismatch", "offset": 0}
+
+		file_name = f"{upload_id}_{session['file_name']}"
+		os.replace(path, frappe.get_site_path("public", "files", file_name))
+
+		scanned_doc = create_scanned_document(
+			document_archive_id=session['document_archive_id'],
+			scanner_name=session['scanner_name'],
+			scanner_type="Mobile App",
+			scan_quality=session['quality'],
+			file_url=f"/files/{file_name}"
+		)
+		frappe.cache().delete_value(get_session_key(upload_id))
+
+		return {
+			"status": "success",
+			"message": "Document uploaded successfully",
+			"scanned_document_id": scanned_doc.name,
+			"file_url": scanned_doc.file_attachment
+		}
+
+	except Exception as e:
+		frappe.log_error(f"Error finalizing upload: {str(e)}")
+		return {"status": "error", "message": str(e)}
+
+def get_session_key(upload_id):
+	"""Cache key of an upload session"""
+	return f"{SESSION_PREFIX}:{upload_id}"
+
+def get_part_path(upload_id):
+	"""Partial file of an upload, outside the public folder until it is verified"""
+	folder = frappe.get_site_path("private", "uploads")
+	os.makedirs(folder, exist_ok=True)
+	return os.path.join(folder, f"{os.path.basename(upload_id)}.part")
+
+def get_session(upload_id):
+	"""Load an upload session owned by the current user"""
+	session = frappe.cache().get_value(get_session_key(upload_id))
+	if not session or session['owner'] != frappe.session.user:
+		frappe.throw(_("Upload {0} not found or expired").format(upload_id))
+	return session
+
+def save_session(session):
+	"""Store an upload session, extending its expiry"""
+	frappe.cache().set_value(get_session_key(session['upload_id']), session,
+							 expires_in_sec=API_CONFIG['upload_session_ttl'])
+
+def remove_stale_uploads():
+	"""Delete partial files whose upload session has expired"""
+	folder = frappe.get_site_path("private", "uploads")
+	if not os.path.isdir(folder):
+		return
+
+	cutoff = time.time() - API_CONFIG['upload_session_ttl']
+	for entry in os.scandir(folder):
+		if entry.name.endswith(".part") and entry.stat().st_mtime < cutoff:
+			os.unlink(entry.path)
\ No newline at end of file
@@ -0,0 +1,270 @@
+import fcntl
+import frappe
+import hashlib
+import json
+import os
+import pickle
+import re
+import time
+
+from document_archiver.api.response_cache import invalidate_archive
+from document_archiver.config import PERFORMANCE_CONFIG
+
+# Every Document Archive keeps one searchable PDF of its OCR'd image pages:
+# the binarized page under an invisible text layer placed from the word
+# boxes. Pages are added as their OCR finishes, each time as a PDF
+# incremental update appended to the end of the file (new page objects, a
+# rewritten page tree and a cross-reference section pointing back to the
+# previous one), so earlier pages are never rewritten. A JSON sidecar holds
+# what the next update needs: the next object number, the last xref offset,
+# the length of the last complete update and the page object of each row.
+#
+# Writers take an exclusive lock on the PDF. A writer that dies mid-update
+# leaves bytes past the recorded length, which the next writer cuts off.
+
+CATALOG = 1
+PAGES = 2
+FONT = 3
+CID_FONT = 4
+FONT_DESCRIPTOR = 5
+TO_UNICODE = 6
+FIRST_PAGE_OBJECT = 7
+
+def get_pdf_name(archive):
+	"""File name of an archive's searchable PDF"""
+	return "archive_{0}.pdf".format(re.sub(r"[^\w.-]", "_", archive))
+
+def get_pdf_path(archive):
+	"""The PDF is private: it is served to users who can read the archive"""
+	return frappe.get_site_path("private", "files", get_pdf_name(archive))
+
+def get_state_path(archive):
+	"""Sidecar with the incremental update state of an archive's PDF"""
+	folder = frappe.get_site_path("private", "archive_pdfs")
+	os.makedirs(folder, exist_ok=True)
+	return os.path.join(folder, f"{os.path.splitext(get_pdf_name(archive))[0]}.json")
+
+def append_archive_pages(scanned_document_names, layer):
+	"""Add an OCR'd page to the searchable PDF of every archive listing it"""
+	rows = frappe.get_all("Scanned Document",
+						  filters={"name": ["in", scanned_document_names], "parenttype": "Document Archive"},
+						  fields=["name", "parent", "idx"])
+
+	for row in rows:
+		try:
+			update_archive_pdf(row.parent, add={row.name: (row.idx, layer)})
+		except Exception as e:
+			# The PDF is a convenience copy; OCR results stand without it
+			frappe.log_error(f"Error adding {row.name} to the searchable PDF of {row.parent}: {str(e)}")
+
+def remove_archive_pages(archive, scanned_document_names):
+	"""Drop removed scanned documents from an archive's PDF"""
+	state = read_state(get_state_path(archive))
+	if state and any(name in state["pages"] for name in scanned_document_names):
+		try:
+			update_archive_pdf(archive, remove=scanned_document_names)
+		except Exception as e:
+			frappe.log_error(f"Error removing pages from the searchable PDF of {archive}: {str(e)}")
+
+def remove_archive_pdf_state(archive):
+	"""Forget the PDF of a deleted archive; the File itself goes with the archive's attachments"""
+	state_path = get_state_path(archive)
+	if os.path.exists(state_path):
+		os.unlink(state_path)
+
+def update_archive_pdf(archive, add=None, remove=None):
+	"""Append and drop pages of an archive's PDF in one incremental update"""
+	pdf_path = get_pdf_path(archive)
+	state_path = get_state_path(archive)
+
+	# Create the file first so every writer locks the same inode
+	open(pdf_path, "ab").close()
+	with open(pdf_path, "r+b") as f:
+		fcntl.flock(f, fcntl.LOCK_EX)
+
+		offsets = {}
+		state = read_state(state_path)
+		created = state is None or os.fstat(f.fileno()).st_size < state["size"]
+		if created:
+			state = {"next_object": FIRST_PAGE_OBJECT, "startxref": None, "size": 0, "pages": {}}
+			f.truncate(0)
+			write_header(f, offsets)
+		else:
+			# Cut off whatever an interrupted writer left after the last complete update
+			f.truncate(state["size"])
+			f.seek(state["size"])
+
+		for name, (idx, layer) in (add or {}).items():
+			state["pages"][name] = [idx, write_page(f, offsets, state, layer)]
+		for name in remove or []:
+			state["pages"].pop(name, None)
+
+		# Pages dropped from the tree stay in the file until it is rebuilt
+		kids = " ".join(f"{page} 0 R" for idx, page in sorted(state["pages"].values()))
+		write_object(f, offsets, PAGES, f"/Type /Pages /Kids [{kids}] /Count {len(state['pages'])}")
+
+		state["startxref"] = write_xref(f, offsets, state)
+		state["size"] = f.tell()
+		f.flush()
+		write_state(state_path, state)
+
+	if created:
+		register_archive_pdf(archive)
+
+def write_header(f, offsets):
+	"""Write the PDF header, the catalog and the glyphless font used by the text layer"""
+	f.write(b"%PDF-1.5\n%\xe2\xe3\xcf\xd3\n")
+	write_object(f, offsets, CATALOG, f"/Type /Catalog /Pages {PAGES} 0 R")
+	write_object(f, offsets, FONT, "/Type /Font /Subtype /Type0 /BaseFont /GlyphLessFont /Encoding /Identity-H "
+				 f"/DescendantFonts [{CID_FONT} 0 R] /ToUnicode {TO_UNICODE} 0 R")
+	write_object(f, offsets, CID_FONT, "/Type /Font /Subtype /CIDFontType2 /BaseFont /GlyphLessFont "
+				 "/CIDSystemInfo << /Registry (Adobe) /Ordering (Identity) /Supplement 0 >> "
+				 f"/FontDescriptor {FONT_DESCRIPTOR} 0 R /CIDToGIDMap /Identity /DW 500")
+	write_object(f, offsets, FONT_DESCRIPTOR, "/Type /FontDescriptor /FontName /GlyphLessFont /Flags 5 "
+				 "/FontBBox [0 0 500 1000] /ItalicAngle 0 /Ascent 1000 /Descent 0 /CapHeight 1000 /StemV 80")
+	write_object(f, offsets, TO_UNICODE, "", get_to_unicode_cmap())
+
+def get_to_unicode_cmap():
+	"""CMap mapping every two-byte code to the same UTF-16 code unit, so text copies out as typed"""
+	ranges = [f"<{high:02X}00> <{high:02X}FF> <{high:02X}00>" for high in range(256) if not 0xD8 <= high <= 0xDF]
+	# At most 100 ranges per bfrange block
+	blocks = [ranges[start:start + 100] for start in range(0, len(ranges), 100)]
+
+	lines = [
+		"/CIDInit /ProcSet findresource begin",
+		"12 dict begin",
+		"begincmap",
+		"/CIDSystemInfo << /Registry (Adobe) /Ordering (UCS) /Supplement 0 >> def",
+		"/CMapName /Adobe-Identity-UCS def",
+		"/CMapType 2 def",
+		"1 begincodespacerange",
+		"<0000> <FFFF>",
+		"endcodespacerange",
+	]
+	for block in blocks:
+		lines += [f"{len(block)} beginbfrange", *block, "endbfrange"]
+	lines += ["endcmap", "CMapName currentdict /CMap defineresource pop", "end", "end"]
+	return "\n".join(lines).encode("ascii")
+
+def write_page(f, offsets, state, layer):
+	"""Write the image, content stream and page objects of a page; returns the page object number"""
+	image, content, page = range(state["next_object"], state["next_object"] + 3)
+	state["next_object"] += 3
+
+	write_object(f, offsets, image, f"/Type /XObject /Subtype /Image /Width {layer['width']} /Height {layer['height']} "
+				 "/ColorSpace /DeviceGray /BitsPerComponent 1 /Filter /FlateDecode", layer["image"])
+	write_object(f, offsets, content, "/Filter /FlateDecode", layer["content"])
+	write_object(f, offsets, page, f"/Type /Page /Parent {PAGES} 0 R "
+				 f"/MediaBox [0 0 {layer['page_width']:.2f} {layer['page_height']:.2f}] "
+				 f"/Resources << /XObject << /Im0 {image} 0 R >> /Font << /F0 {FONT} 0 R >> >> "
+				 f"/Contents {content} 0 R")
+	return page
+
+def write_object(f, offsets, number, entries, stream=None):
+	"""Write an indirect dictionary or stream object and record its offset"""
+	offsets[number] = f.tell()
+	if stream is None:
+		f.write(f"{number} 0 obj\n<< {entries} >>\nendobj\n".encode("ascii"))
+	else:
+		f.write(f"{number} 0 obj\n<< {entries} /Length {len(stream)} >>\nstream\n".encode("ascii"))
+		f.write(stream)
+		f.write(b"\nendstream\nendobj\n")
+
+def write_xref(f, offsets, state):
+	"""Write the xref section and trailer of the objects written in this update; returns its offset"""
+	start = f.tell()
+	# Every entry is exactly 20 bytes, end of line included
+	entries = {number: f"{offset:010d} 00000 n \n" for number, offset in offsets.items()}
+	if state["startxref"] is None:
+		entries[0] = "0000000000 65535 f \n"
+
+	# One subsection per run of consecutive object numbers
+	sections = []
+	for number in sorted(entries):
+		if sections and number == sections[-1][0] + len(sections[-1][1]):
+			sections[-1][1].append(entries[number])
+		else:
+			sections.append((number, [entries[number]]))
+
+	xref = ["xref\n"]
+	for first, lines in sections:
+		xref.append(f"{first} {len(lines)}\n")
+		xref.extend(lines)
+
+	previous = f" /Prev {state['startxref']}" if state["startxref"] is not None else ""
+	xref.append(f"trailer\n<< /Size {state['next_object']} /Root {CATALOG} 0 R{previous} >>\n")
+	xref.append(f"startxref\n{start}\n%%EOF\n")
+	f.write("".join(xref).encode("ascii"))
+	return start
+
+def read_state(state_path):
+	"""Load an archive PDF's update state, None when there is no PDF yet"""
+	try:
+		with open(state_path) as f:
+			return json.load(f)
+	except FileNotFoundError:
+		return None
+
+def write_state(state_path, state):
+	"""Replace the update state atomically, so it never describes a half-written update"""
+	temp_path = f"{state_path}.tmp"
+	with open(temp_path, "w") as f:
+		json.dump(state, f)
+	os.replace(temp_path, state_path)
+
+def register_archive_pdf(archive):
+	"""Attach a newly created PDF to its archive"""
+	file_url = f"/private/files/{get_pdf_name(archive)}"
+	if not frappe.db.exists("File", {"file_url": file_url}):
+		frappe.get_doc({
+			"doctype": "File",
+			"file_name": get_pdf_name(archive),
+			"file_url": file_url,
+			"is_private": 1,
+			"attached_to_doctype": "Document Archive",
+			"attached_to_name": archive,
+			"attached_to_field": "searchable_pdf"
+		}).insert(ignore_permissions=True)
+
+	frappe.db.set_value("Document Archive", archive, "searchable_pdf", file_url, update_modified=False)
+	frappe.db.commit()
+	invalidate_archive(archive, lists=False)
+
+def get_layer_path(cache_key):
+	"""On-disk copy of a page layer, kept next to the OCR text cache entry"""
+	folder = frappe.get_site_path("private", "ocr_layers")
+	os.makedirs(folder, exist_ok=True)
+	return os.path.join(folder, f"{hashlib.sha256(cache_key.encode()).hexdigest()[:32]}.pickle")
+
+def save_page_layer(cache_key, layer):
+	"""Keep a page layer so an OCR cache hit can still add the page to a PDF"""
+	if not PERFORMANCE_CONFIG['enable_caching']:
+		return
+
+	path = get_layer_path(cache_key)
+	with open(f"{path}.tmp", "wb") as f:
+		pickle.dump(layer, f)
+	os.replace(f"{path}.tmp", path)
+
+def load_page_layer(cache_key):
+	"""Load a kept page layer, None when it is gone"""
+	path = get_layer_path(cache_key)
+	try:
+		with open(path, "rb") as f:
+			layer = pickle.load(f)
+	except FileNotFoundError:
+		return None
+
+	os.utime(path)
+	return layer
+
+def remove_stale_page_layers():
+	"""Scheduler: delete page layers unused for longer than the OCR cache keeps text"""
+	folder = frappe.get_site_path("private", "ocr_layers")
+	if not os.path.isdir(folder):
+		return
+
+	cutoff = time.time() - PERFORMANCE_CONFIG['cache_ttl']
+	for entry in os.scandir(folder):
+		if entry.stat().st_mtime < cutoff:
+			os.unlink(entry.path)
\ No newline at end of file
@@ -6,6 +6,7 @@ TESSERACT_CONFIG = {
     'psm_mode': 6,  # Page segmentation mode
     'oem_mode': 3,  # OCR Engine mode
     'timeout': 30,  # Timeout in seconds
+    'engine': 'auto',  # auto, tesserocr (in-process) or pytesseract (CLI)
 }
 
 # Scanner Configuration
@@ -14,28 +15,73 @@ SCANNER_CONFIG = {
         'default_resolution': (640, 480),
         'max_resolution': (1920, 1080),
         'supported_formats': ['image/jpeg', 'image/png'],
+        'buffer_frames': 8,  # Recent frames kept to pick the sharpest from
+        'warmup_frames': 10,  # Frames dropped after opening while exposure settles
+        'capture_timeout': 5,  # Seconds to wait for frames when capturing
+        'idle_release': 120,  # Seconds without captures before the camera is released
     },
     'sane': {
         'default_dpi': 300,
         'max_dpi': 1200,
         'supported_formats': ['image/png', 'image/tiff'],
         'timeout': 60,
+        'batch_timeout': 3600,  # Seconds a whole feeder batch scan may take
     },
     'twain': {
         'timeout': 60,
         'supported_formats': ['image/png', 'image/tiff', 'image/jpeg'],
+    },
+    'health': {
+        'probe_timeout': 15,  # Seconds a single connection probe may take
+        'max_workers': 8,  # Probes run concurrently
+        'stale_after': 600,  # Seconds after which cached status triggers a refresh
+    },
+    'discovery': {
+        'ttl': 300,  # Seconds before cached device discovery is refreshed
+        'timeout': 30,  # Seconds allowed for scanimage -L
     }
 }
 
 # File Processing Configuration
 FILE_PROCESSING = {
     'max_file_size': 50 * 1024 * 1024,  # 50MB
-    'supported_formats': ['.pdf', '.png', '.jpg', '.jpeg', '.tiff', '.bmp'],
+    'supported_formats': ['.pdf', '.png', '.jpg', '.jpeg', '.tiff', '.bmp', '.webp'],
     'image_quality': 85,
     'max_image_dimension': 2048,
     'auto_rotate': True,
     'auto_crop': True,
     'auto_deskew': True,
+    'denoise_strength': 3,  # fastNlMeansDenoising h for grayscale pages
+    'color_denoise_strength': 10,  # fastNlMeansDenoisingColored h for camera frames
+    'noise_skip_below': 2.0,  # Estimated noise sigma under which denoising is skipped
+    'noise_full_above': 6.0,  # Noise sigma from which full NL-means is used
+    'threshold_block_size': 11,  # Adaptive threshold neighbourhood (odd)
+    'threshold_c': 2,  # Adaptive threshold offset
+    'geometry_proxy_size': 600,  # Longest side of the proxy used to find rotation, skew and crop
+    'max_skew_angle': 10,  # Largest skew in degrees corrected by auto_deskew
+    'pdf_dpi': 200,  # Rasterization DPI for PDF pages sent to OCR
+    'pdf_text_layer_min_chars': 20,  # Pages with less embedded text are OCR'd
+}
+
+# Storage Encoding Configuration
+ENCODING_CONFIG = {
+    # Format per color mode: tiff_g4 (bilevel CCITT Group 4), jpeg, webp or png
+    'profiles': {
+        'Black & White': {'format': 'tiff_g4'},
+        'Grayscale': {'format': 'jpeg', 'quality': {'Draft': 60, 'Normal': 75, 'High': 85}},
+        'Color': {'format': 'webp', 'quality': {'Draft': 60, 'Normal': 75, 'High': 85}},
+    },
+    'lossless_qualities': ['Maximum'],  # Scan qualities stored losslessly (PNG, or G4 for bilevel)
+    'png_compress_level': 3,  # zlib level; higher is smaller and slower
+    'webp_method': 4,  # 0 (fast) to 6 (small)
+}
+
+# Preview Configuration
+PREVIEW_CONFIG = {
+    'sizes': {'thumbnail': 256, 'screen': 1024, 'full': 2048},  # Longest side in pixels, smallest first
+    'quality': 80,  # WebP quality of the previews
+    'pdf_dpi': 150,  # Rasterization DPI for the first page of PDFs
+    'folder': 'previews',  # Under public/files, or private/files for private sources
 }
 
 # API Configuration
@@ -44,6 +90,8 @@ API_CONFIG = {
     'max_file_size': 50 * 1024 * 1024,  # 50MB
     'timeout': 300,  # 5 minutes
     'allowed_origins': ['*'],  # Configure for production
+    'upload_chunk_size': 5 * 1024 * 1024,  # Largest accepted chunk of a resumable upload
+    'upload_session_ttl': 24 * 3600,  # Seconds an unfinished upload can be resumed
 }
 
 # Mobile App Configuration
@@ -75,9 +123,31 @@ SECURITY_CONFIG = {
 PERFORMANCE_CONFIG = {
     'enable_caching': True,
     'cache_ttl': 3600,  # 1 hour
+    'ocr_cache_max_entries': 10000,
     'batch_processing_size': 10,
     'parallel_processing': True,
     'max_workers': 4,
+    'ocr_queue': 'long',  # Background job queue used for OCR
+    'ocr_batch_size': 100,  # Rows per OCR job; its pool loads the tesseract models once
+    'ocr_job_timeout': 3600,  # Seconds per OCR batch job
+    'pdf_page_window': 8,  # PDF pages queued for OCR at once
+}
+
+# Search Configuration
+SEARCH_CONFIG = {
+    'min_term_length': 2,
+    'max_term_length': 64,
+    'bm25_k1': 1.2,  # Term frequency saturation
+    'fuzzy_similarity_threshold': 0.4,  # Minimum trigram similarity for fuzzy matches
+    'fuzzy_max_candidates': 200,  # Vocabulary terms scored per query token
+    'fuzzy_max_expansions': 5,  # Similar terms kept per query token
+    'fuzzy_time_budget_ms': 250,
+    'field_boosts': {
+        'title': 3.0,
+        'tags': 2.0,
+        'description': 1.0,
+        'ocr_text': 1.0,
+    },
 }
 
 # Logging Configuration
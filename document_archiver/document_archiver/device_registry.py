@@ -0,0 +1,92 @@
+import frappe
+import subprocess
+import time
+
+from document_archiver.config import SCANNER_CONFIG
+
+# Cached hardware discovery. Enumerating SANE devices can take many seconds
+# when saned hosts are on the network, and probing the webcam grabs the
+# device, so requests read the last discovery from the cache and a
+# background job refreshes it once it is older than the configured TTL.
+
+REGISTRY_KEY = "document_archiver:device_registry"
+REFRESH_LOCK_KEY = f"{REGISTRY_KEY}:refreshing"
+QUEUED_KEY = f"{REGISTRY_KEY}:queued"
+
+def discover_sane():
+	"""Whether SANE is usable and which devices scanimage -L lists"""
+	try:
+		result = subprocess.run(['scanimage', '-L'], capture_output=True, text=True,
+								timeout=SCANNER_CONFIG['discovery']['timeout'])
+	except subprocess.TimeoutExpired:
+		return {"installed": True, "error": "SANE device listing timed out", "devices": []}
+	except FileNotFoundError:
+		return {"installed": False, "error": "SANE (scanimage) not found. Please install SANE tools", "devices": []}
+
+	if result.returncode != 0:
+		return {"installed": False, "error": "SANE is not properly installed or configured", "devices": []}
+
+	devices = [line.strip() for line in result.stdout.split('\n') if 'device' in line.lower()]
+	return {"installed": True, "error": None, "devices": devices}
+
+def discover_webcam():
+	"""Whether the default webcam can be opened"""
+	try:
+		import cv2
+	except ImportError:
+		return {"available": False, "error": "OpenCV not installed. Please install opencv-python"}
+
+	from document_archiver.webcam import is_session_open
+
+	# Opening a camera held by a capture session would fail or disturb it
+	if is_session_open(0):
+		return {"available": True, "error": None}
+
+	cap = cv2.VideoCapture(0)
+	try:
+		if cap.isOpened():
+			return {"available": True, "error": None}
+		return {"available": False, "error": "No webcam found or webcam is being used by another application"}
+	finally:
+		cap.release()
+
+def refresh_device_registry():
+	"""Background job: enumerate scanners and webcams and cache the result"""
+	cache = frappe.cache()
+	if cache.get_value(REFRESH_LOCK_KEY):
+		return cache.get_value(REGISTRY_KEY)
+	cache.set_value(REFRESH_LOCK_KEY, 1, expires_in_sec=SCANNER_CONFIG['discovery']['timeout'] * 2)
+
+	try:
+		registry = {
+			"discovered_at": time.time(),
+			"sane": discover_sane(),
+			"webcam": discover_webcam(),
+		}
+		cache.set_value(REGISTRY_KEY, registry)
+		return registry
+	finally:
+		cache.delete_value([REFRESH_LOCK_KEY, QUEUED_KEY])
+
+def get_device_registry():
+	"""Last discovery result, or None before the first one; queues a refresh when stale"""
+	cache = frappe.cache()
+	registry = cache.get_value(REGISTRY_KEY)
+	stale = not registry or time.time() - registry["discovered_at"] > SCANNER_CONFIG['discovery']['ttl']
+	# One queued refresh at a time; the flag expires in case the job is lost
+	if stale and not cache.get_value(QUEUED_KEY):
+		cache.set_value(QUEUED_KEY, 1, expires_in_sec=SCANNER_CONFIG['discovery']['timeout'] * 2)
+		frappe.enqueue("document_archiver.device_registry.refresh_device_registry", queue="short")
+	return registry
+
+@frappe.whitelist()
+def rescan_devices():
+	"""Re-enumerate devices now and return the available scanners"""
+	try:
+		from document_archiver.doctype.scanner_config.scanner_config import list_scanners
+
+		return {"status": "success", "scanners": list_scanners(refresh_device_registry())}
+
+	except Exception as e:
+		frappe.log_error(f"Error rescanning devices: {str(e)}")
+		return {"status": "error", "message": str(e)}
\ No newline at end of file
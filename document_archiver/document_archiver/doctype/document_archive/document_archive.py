@@ -2,10 +2,14 @@ import frappe
 from frappe.model.document import Document
 from frappe import _
 import os
-from PIL import Image
-import pytesseract
-import cv2
-import numpy as np
+
+from document_archiver.api.response_cache import invalidate_archive
+from document_archiver.archive_pdf import remove_archive_pages, remove_archive_pdf_state
+from document_archiver.doctype.scanned_document.scanned_document import keep_ocr_results, keep_previews, needs_processing, reset_previews
+from document_archiver.files import get_file_paths, stat_file
+from document_archiver.previews import enqueue_previews
+from document_archiver.search.index import index_archive, remove_archive, remove_document
+from document_archiver.tasks import enqueue_ocr
 
 class DocumentArchive(Document):
 	def validate(self):
@@ -16,6 +20,15 @@ class DocumentArchive(Document):
 	def before_save(self):
 		self.process_scanned_documents()
 	
+	def on_update(self):
+		self.enqueue_pending_ocr()
+		self.enqueue_missing_previews()
+		self.update_search_index()
+	
+	def on_trash(self):
+		remove_archive(self.name)
+		remove_archive_pdf_state(self.name)
+	
 	def set_creation_date(self):
 		if not self.created_date:
 			self.created_date = frappe.utils.today()
@@ -40,94 +53,127 @@ class DocumentArchive(Document):
 			})
 	
 	def process_scanned_documents(self):
-		"""Process all scanned documents for OCR and metadata extraction"""
+		"""Refresh metadata of new or replaced files and mark rows whose content needs OCR"""
+		doc_before_save = self.get_doc_before_save()
+		previous_rows = {doc.name: doc for doc in doc_before_save.scanned_documents} if doc_before_save else {}
+		
+		# A form opened before OCR or previews finished must not write back its older results
 		for doc in self.scanned_documents:
-			if doc.file_attachment and not doc.ocr_text:
-				doc.ocr_text = self.extract_text_from_file(doc.file_attachment)
-				doc.file_size = self.get_file_size(doc.file_attachment)
-				doc.file_type = self.get_file_type(doc.file_attachment)
+			previous = previous_rows.get(doc.name)
+			if previous and previous.file_attachment == doc.file_attachment:
+				keep_ocr_results(doc, previous)
+				keep_previews(doc, previous)
+		
+		# Only new or replaced attachments are looked up, all in one File query
+		replaced = [doc for doc in self.scanned_documents if doc.file_attachment
+					and (doc.name not in previous_rows or previous_rows[doc.name].file_attachment != doc.file_attachment)]
+		paths = get_file_paths([doc.file_attachment for doc in replaced])
+		for doc in replaced:
+			path = paths.get(doc.file_attachment)
+			doc.file_size, doc.file_type = stat_file(path) if path else (0, "")
+			reset_previews(doc)
+		
+		for doc in self.scanned_documents:
+			if not doc.file_attachment or doc.processing_status in ("Pending", "Processing"):
+				continue
+			if needs_processing(doc, previous_rows.get(doc.name), paths.get(doc.file_attachment)):
+				doc.processing_status = "Pending"
 	
-	def extract_text_from_file(self, file_path):
-		"""Extract text from uploaded file using OCR"""
-		try:
-			file_doc = frappe.get_doc("File", {"file_url": file_path})
-			full_path = file_doc.get_full_path()
-			
-			# Check file type and process accordingly
-			file_extension = os.path.splitext(full_path)[1].lower()
-			
-			if file_extension in ['.png', '.jpg', '.jpeg', '.tiff', '.bmp']:
-				return self.extract_text_from_image(full_path)
-			elif file_extension == '.pdf':
-				return self.extract_text_from_pdf(full_path)
-			else:
-				return ""
-		except Exception as e:
-			frappe.log_error(f"Error extracting text from {file_path}: {str(e)}")
-			return ""
+	def enqueue_pending_ocr(self):
+		"""Queue OCR for rows that became Pending in this save"""
+		doc_before_save = self.get_doc_before_save()
+		previous_status = {doc.name: doc.processing_status for doc in doc_before_save.scanned_documents} if doc_before_save else {}
+		# Rows already Pending before were queued then, or are re-queued by the scheduler
+		enqueue_ocr([doc.name for doc in self.scanned_documents
+					 if doc.file_attachment and doc.processing_status == "Pending"
+					 and (doc.name not in previous_status or previous_status[doc.name] != "Pending")])
 	
-	def extract_text_from_image(self, image_path):
-		"""Extract text from image using OCR"""
-		try:
-			# Load image
-			image = cv2.imread(image_path)
-			
-			# Preprocess image for better OCR
-			gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-			
-			# Apply denoising
-			denoised = cv2.fastNlMeansDenoising(gray)
-			
-			# Apply threshold
-			_, thresh = cv2.threshold(denoised, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
-			
-			# Extract text using pytesseract
-			text = pytesseract.image_to_string(thresh, config='--psm 6')
-			
-			return text.strip()
-		except Exception as e:
-			frappe.log_error(f"Error in OCR processing: {str(e)}")
-			return ""
+	def enqueue_missing_previews(self):
+		"""Queue preview generation for scanned documents never queued since their file was set"""
+		enqueue_previews([doc.name for doc in self.scanned_documents
+						  if doc.file_attachment and not doc.preview_status])
 	
-	def extract_text_from_pdf(self, pdf_path):
-		"""Extract text from PDF"""
-		try:
-			from pdf2image import convert_from_path
-			
-			# Convert PDF to images
-			images = convert_from_path(pdf_path)
-			text = ""
-			
-			for image in images:
-				# Convert PIL image to OpenCV format
-				img_array = np.array(image)
-				img_cv = cv2.cvtColor(img_array, cv2.COLOR_RGB2BGR)
-				
-				# Extract text
-				page_text = pytesseract.image_to_string(img_cv, config='--psm 6')
-				text += page_text + "\n"
-			
-			return text.strip()
-		except Exception as e:
-			frappe.log_error(f"Error extracting text from PDF: {str(e)}")
-			return ""
+	def update_search_index(self):
+		"""Re-index changed archive fields and drop removed scanned documents from the index and PDF"""
+		if any(self.has_value_changed(field) for field in ("title", "tags", "description")):
+			index_archive(self)
+		
+		doc_before_save = self.get_doc_before_save()
+		if doc_before_save:
+			current_rows = {doc.name for doc in self.scanned_documents}
+			removed_rows = [doc.name for doc in doc_before_save.scanned_documents if doc.name not in current_rows]
+			for name in removed_rows:
+				remove_document("Scanned Document", name)
+			if removed_rows:
+				remove_archive_pages(self.name, removed_rows)
+
+def on_doctype_update():
+	# Serves the keyset pagination in api.mobile.get_document_archive_list
+	frappe.db.add_index("Document Archive", ["modified_date", "name"])
+
+def attach_scanned_documents(document_archive_id, rows):
+	"""Insert new Scanned Document rows into an archive without loading or saving its existing rows"""
+	frappe.has_permission("Document Archive", "write", document_archive_id, throw=True)
+	
+	# Locking the archive keeps row positions unique between concurrent attaches
+	if not frappe.db.get_value("Document Archive", document_archive_id, "name", for_update=True):
+		frappe.throw(_("Document Archive {0} not found").format(document_archive_id))
+	idx = frappe.db.sql("""
+		SELECT COALESCE(MAX(idx), 0)
+		FROM `tabScanned Document`
+		WHERE parent = %s AND parenttype = 'Document Archive' AND parentfield = 'scanned_documents'
+	""", (document_archive_id,))[0][0]
+	
+	docs = []
+	for row in rows:
+		idx += 1
+		doc = frappe.get_doc(dict(row,
+								  doctype="Scanned Document",
+								  parent=document_archive_id,
+								  parenttype="Document Archive",
+								  parentfield="scanned_documents",
+								  idx=idx))
+		# What the archive's save would have done for this row alone
+		doc.set_scan_time()
+		doc.process_file()
+		doc.db_insert()
+		docs.append(doc)
 	
-	def get_file_size(self, file_path):
-		"""Get file size in bytes"""
-		try:
-			file_doc = frappe.get_doc("File", {"file_url": file_path})
-			full_path = file_doc.get_full_path()
-			return os.path.getsize(full_path)
-		except:
-			return 0
+	# set_value also moves `modified`, so the archive rises in recently-changed lists
+	frappe.db.set_value("Document Archive", document_archive_id, "modified_date", frappe.utils.today())
 	
-	def get_file_type(self, file_path):
-		"""Get file type from extension"""
-		try:
-			file_doc = frappe.get_doc("File", {"file_url": file_path})
-			return os.path.splitext(file_doc.file_name)[1].lower()
-		except:
-			return ""
+	enqueue_ocr([doc.name for doc in docs if doc.processing_status == "Pending"])
+	enqueue_previews([doc.name for doc in docs])
+	# Row inserts bypass doc_events, so drop the cached responses here
+	invalidate_archive(document_archive_id)
+	return docs
+
+@frappe.whitelist()
+def reprocess_document_archive(document_archive_id):
+	"""Queue every scanned page of an archive for OCR again"""
+	try:
+		frappe.has_permission("Document Archive", "write", document_archive_id, throw=True)
+		
+		names = frappe.get_all("Scanned Document",
+							   filters={"parent": document_archive_id,
+										"parenttype": "Document Archive",
+										"file_attachment": ["is", "set"],
+										"processing_status": ["!=", "Processing"]},
+							   pluck="name")
+		if names:
+			frappe.db.sql("""
+				UPDATE `tabScanned Document`
+				SET processing_status = 'Pending'
+				WHERE name IN %s
+			""", (tuple(names),))
+		enqueue_ocr(names)
+		invalidate_archive(document_archive_id, lists=False)
+		
+		return {"status": "success", "message": f"{len(names)} pages queued for reprocessing"}
+		
+	except Exception as e:
+		frappe.log_error(f"Error reprocessing document archive: {str(e)}")
+		return {"status": "error", "message": str(e)}
 
 @frappe.whitelist()
 def scan_document_with_scanner(document_archive_id, scanner_type="webcam"):
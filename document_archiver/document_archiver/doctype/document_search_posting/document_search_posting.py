@@ -0,0 +1,10 @@
+import frappe
+from frappe.model.document import Document
+
+class DocumentSearchPosting(Document):
+	pass
+
+def on_doctype_update():
+	# Covers the term lookup in search.index.rank_postings without reading table rows
+	frappe.db.add_index("Document Search Posting",
+						["term", "reference_doctype", "reference_name", "weight", "archive"])
\ No newline at end of file
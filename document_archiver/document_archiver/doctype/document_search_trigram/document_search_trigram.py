@@ -0,0 +1,9 @@
+import frappe
+from frappe.model.document import Document
+
+class DocumentSearchTrigram(Document):
+	pass
+
+def on_doctype_update():
+	# Covers the candidate lookup in search.fuzzy.find_similar_terms
+	frappe.db.add_index("Document Search Trigram", ["trigram", "term"])
\ No newline at end of file
@@ -5,6 +5,8 @@ import json
 import subprocess
 import platform
 
+from document_archiver.device_registry import get_device_registry
+
 class ScannerConfig(Document):
 	def validate(self):
 		self.validate_scanner_connection()
@@ -46,66 +48,43 @@ class ScannerConfig(Document):
 			frappe.throw(_("TWAIN connection validation failed: {0}").format(str(e)))
 	
 	def validate_sane_connection(self):
-		"""Validate SANE scanner connection"""
-		try:
-			# Check if SANE is installed and working
-			result = subprocess.run(['scanimage', '--version'], 
-								  capture_output=True, text=True, timeout=10)
-			if result.returncode != 0:
-				frappe.throw(_("SANE is not properly installed or configured"))
-		except subprocess.TimeoutExpired:
-			frappe.throw(_("SANE validation timed out"))
-		except FileNotFoundError:
-			frappe.throw(_("SANE (scanimage) not found. Please install SANE tools"))
-		except Exception as e:
-			frappe.throw(_("SANE connection validation failed: {0}").format(str(e)))
+		"""Validate SANE scanner connection against the cached device discovery"""
+		registry = get_device_registry()
+		if registry and not registry["sane"]["installed"]:
+			frappe.throw(_(registry["sane"]["error"]))
 	
 	def validate_webcam_connection(self):
-		"""Validate webcam connection"""
-		try:
-			import cv2
-			cap = cv2.VideoCapture(0)
-			if not cap.isOpened():
-				frappe.throw(_("No webcam found or webcam is being used by another application"))
-			cap.release()
-		except ImportError:
-			frappe.throw(_("OpenCV not installed. Please install opencv-python"))
-		except Exception as e:
-			frappe.throw(_("Webcam validation failed: {0}").format(str(e)))
+		"""Validate webcam connection against the cached device discovery"""
+		registry = get_device_registry()
+		if registry and not registry["webcam"]["available"]:
+			frappe.throw(_(registry["webcam"]["error"]))
 
 @frappe.whitelist()
 def get_available_scanners():
-	"""Get list of available scanners"""
+	"""Get list of available scanners from the device registry"""
+	return list_scanners(get_device_registry())
+
+def list_scanners(registry):
+	"""Scanner entries for a device registry snapshot"""
 	scanners = []
+	if not registry:
+		return scanners
 	
 	# Check for SANE scanners
-	try:
-		result = subprocess.run(['scanimage', '-L'], 
-							  capture_output=True, text=True, timeout=10)
-		if result.returncode == 0:
-			for line in result.stdout.split('\n'):
-				if 'device' in line.lower():
-					scanners.append({
-						'type': 'SANE',
-						'name': line.strip(),
-						'description': 'SANE-compatible scanner'
-					})
-	except:
-		pass
+	for device in registry["sane"]["devices"]:
+		scanners.append({
+			'type': 'SANE',
+			'name': device,
+			'description': 'SANE-compatible scanner'
+		})
 	
 	# Check for webcam
-	try:
-		import cv2
-		cap = cv2.VideoCapture(0)
-		if cap.isOpened():
-			scanners.append({
-				'type': 'Webcam',
-				'name': 'Default Webcam',
-				'description': 'Built-in or USB webcam'
-			})
-		cap.release()
-	except:
-		pass
+	if registry["webcam"]["available"]:
+		scanners.append({
+			'type': 'Webcam',
+			'name': 'Default Webcam',
+			'description': 'Built-in or USB webcam'
+		})
 	
 	return scanners
 
@@ -0,0 +1,85 @@
+import cv2
+import frappe
+import io
+import numpy as np
+import time
+from PIL import Image
+
+from document_archiver.config import ENCODING_CONFIG
+
+# Storage encoding of captured pages. The format follows the page's color
+# mode and scan quality (see ENCODING_CONFIG): bilevel pages are stored as
+# CCITT Group 4 TIFF, grayscale and color pages as JPEG or WebP at a quality
+# tuned per scan quality, and lossless qualities as PNG.
+
+EXTENSIONS = {
+	"tiff_g4": ".tiff",
+	"jpeg": ".jpg",
+	"webp": ".webp",
+	"png": ".png",
+}
+
+def get_encoding_profile(scan_quality=None, color_mode=None):
+	"""Format and lossy quality for a scan quality and color mode"""
+	profiles = ENCODING_CONFIG['profiles']
+	profile = profiles.get(color_mode) or profiles['Color']
+
+	if profile['format'] != "tiff_g4" and scan_quality in ENCODING_CONFIG['lossless_qualities']:
+		return {"format": "png", "quality": None}
+	return {"format": profile['format'], "quality": profile.get('quality', {}).get(scan_quality or "High")}
+
+def to_8bit(image):
+	"""Reduce a 16-bit grayscale PIL image to 8 bits; PIL's own conversion clips instead"""
+	if image.mode == "I;16":
+		return Image.fromarray((np.asarray(image) >> 8).astype(np.uint8))
+	return image
+
+def to_bilevel(image):
+	"""Otsu-binarize a PIL image into mode "1" without dithering"""
+	gray = np.asarray(to_8bit(image).convert("L"))
+	bilevel = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)[1]
+	return Image.fromarray(bilevel).convert("1", dither=Image.Dither.NONE)
+
+def encode_image(image, scan_quality=None, color_mode=None, quality=None):
+	"""Encode a PIL image or RGB/grayscale array for storage; returns (bytes, extension, stats)
+
+	quality overrides the profile's lossy quality, e.g. when a client asks for one."""
+	started = time.perf_counter()
+	profile = get_encoding_profile(scan_quality, color_mode)
+	if isinstance(image, np.ndarray):
+		image = Image.fromarray(image)
+
+	bytes_per_pixel = 2 if image.mode == "I;16" else len(image.getbands())
+	raw_bytes = image.width * image.height * bytes_per_pixel
+
+	if color_mode == "Grayscale" and image.mode not in ("L", "I;16"):
+		image = image.convert("L")
+
+	output = io.BytesIO()
+	if profile['format'] == "tiff_g4":
+		to_bilevel(image).save(output, format="TIFF", compression="group4")
+	elif profile['format'] == "png":
+		image.save(output, format="PNG", compress_level=ENCODING_CONFIG['png_compress_level'])
+	else:
+		image = to_8bit(image)
+		if image.mode not in ("L", "RGB"):
+			image = image.convert("RGB")
+		options = {"quality": quality or profile['quality']}
+		if profile['format'] == "webp":
+			options["method"] = ENCODING_CONFIG['webp_method']
+		image.save(output, format=profile['format'].upper(), **options)
+
+	data = output.getvalue()
+	stats = {
+		"format": profile['format'],
+		"quality": quality or profile['quality'],
+		"encode_ms": round((time.perf_counter() - started) * 1000, 1),
+		"bytes": len(data),
+		"raw_bytes": raw_bytes,
+		"saved_bytes": raw_bytes - len(data),
+	}
+	return data, EXTENSIONS[profile['format']], stats
+
+def log_encoding_stats(stats, **context):
+	"""Record the outcome of a storage encode"""
+	frappe.logger("document_archiver").info(dict(context, event="storage_encode", **stats))
\ No newline at end of file
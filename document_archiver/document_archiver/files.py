@@ -0,0 +1,36 @@
+import frappe
+import os
+
+# File lookups for many scanned pages at once: one query for every File
+# record behind the given URLs, and one stat per file for its metadata,
+# instead of loading a File document per row and per attribute.
+
+def get_file_paths(file_urls):
+	"""{file_url: full path on disk} for the File records behind the URLs"""
+	file_urls = list(dict.fromkeys(url for url in file_urls if url))
+	if not file_urls:
+		return {}
+
+	records = frappe.get_all("File",
+							 filters={"file_url": ["in", file_urls]},
+							 fields=["file_url", "file_name", "is_private"],
+							 order_by="creation asc")
+
+	paths = {}
+	for record in records:
+		if record.file_url not in paths:
+			# An unsaved File resolves the path from its fields without a query
+			paths[record.file_url] = frappe.get_doc(dict(record, doctype="File")).get_full_path()
+	return paths
+
+def get_file_metadata(file_urls):
+	"""{file_url: (size in bytes, extension)} with one stat per file"""
+	return {file_url: stat_file(path) for file_url, path in get_file_paths(file_urls).items()}
+
+def stat_file(path):
+	"""(size in bytes, extension) of a file; the size is 0 when it cannot be read"""
+	try:
+		size = os.stat(path).st_size
+	except OSError:
+		size = 0
+	return size, os.path.splitext(path)[1].lower()
\ No newline at end of file
@@ -103,6 +103,18 @@ app_license = "MIT"
 #	}
 # }
 
+doc_events = {
+	"Document Archive": {
+		"on_update": "document_archiver.api.response_cache.invalidate_for_doc",
+		"on_trash": "document_archiver.api.response_cache.invalidate_for_doc",
+		"after_rename": "document_archiver.api.response_cache.invalidate_for_doc"
+	},
+	"Scanned Document": {
+		"on_update": "document_archiver.api.response_cache.invalidate_for_doc",
+		"on_trash": "document_archiver.api.response_cache.invalidate_for_doc"
+	}
+}
+
 # Scheduled Tasks
 # ---------------
 
@@ -124,6 +136,20 @@ app_license = "MIT"
 #	]
 # }
 
+scheduler_events = {
+	"all": [
+		"document_archiver.tasks.enqueue_stale_ocr_jobs",
+		"document_archiver.scanner_health.refresh_scanner_health"
+	],
+	"hourly": [
+		"document_archiver.device_registry.refresh_device_registry",
+		"document_archiver.archive_pdf.remove_stale_page_layers"
+	],
+	"daily": [
+		"document_archiver.api.upload.remove_stale_uploads"
+	]
+}
+
 # Testing
 # -------
 
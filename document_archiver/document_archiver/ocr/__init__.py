@@ -0,0 +1 @@
+# OCR module for Document Archiver
\ No newline at end of file
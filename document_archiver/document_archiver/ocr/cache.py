@@ -0,0 +1,79 @@
+import frappe
+import hashlib
+import json
+import redis
+import time
+
+from document_archiver.config import PERFORMANCE_CONFIG
+
+CACHE_PREFIX = "document_archiver:ocr"
+INDEX_KEY = f"{CACHE_PREFIX}:index"
+STATS_KEY = f"{CACHE_PREFIX}:stats"
+
+def hash_file(file_path, chunk_size=1024 * 1024):
+	"""SHA-256 of a file's content, read in chunks"""
+	digest = hashlib.sha256()
+	with open(file_path, 'rb') as f:
+		for chunk in iter(lambda: f.read(chunk_size), b''):
+			digest.update(chunk)
+	return digest.hexdigest()
+
+def get_cache_key(content_hash, pipeline_settings):
+	"""Cache key for a file's content processed with the given pipeline settings"""
+	settings_hash = hashlib.sha256(json.dumps(pipeline_settings, sort_keys=True).encode()).hexdigest()
+	return f"{CACHE_PREFIX}:{content_hash}:{settings_hash[:16]}"
+
+def get_cached_text(cache_key):
+	"""Return cached OCR text, or None on a miss"""
+	if not PERFORMANCE_CONFIG['enable_caching']:
+		return None
+
+	cache = frappe.cache()
+	text = cache.get_value(cache_key)
+	cache.hincrby(cache.make_key(STATS_KEY), "hits" if text is not None else "misses", 1)
+	return text
+
+def set_cached_text(cache_key, text):
+	"""Store OCR text, evicting the oldest entries beyond the size limit"""
+	if not PERFORMANCE_CONFIG['enable_caching']:
+		return
+
+	cache = frappe.cache()
+	ttl = PERFORMANCE_CONFIG['cache_ttl']
+	index_key = cache.make_key(INDEX_KEY)
+	now = time.time()
+
+	cache.set_value(cache_key, text, expires_in_sec=ttl)
+	cache.zadd(index_key, {cache_key: now})
+
+	# Entries past their TTL are already gone from redis
+	cache.zremrangebyscore(index_key, 0, now - ttl)
+
+	excess = cache.zcard(index_key) - PERFORMANCE_CONFIG['ocr_cache_max_entries']
+	if excess > 0:
+		evicted = [key.decode() for key in cache.zrange(index_key, 0, excess - 1)]
+		cache.delete_value(evicted)
+		cache.zrem(index_key, *evicted)
+
+@frappe.whitelist()
+def get_ocr_cache_stats():
+	"""Get OCR cache hit/miss counters"""
+	try:
+		cache = frappe.cache()
+		# Raw client: RedisWrapper.hgetall would prefix the key again and unpickle the counters
+		stats = redis.Redis.hgetall(cache, cache.make_key(STATS_KEY))
+		hits = int(stats.get(b"hits", 0))
+		misses = int(stats.get(b"misses", 0))
+
+		return {
+			"status": "success",
+			"enabled": PERFORMANCE_CONFIG['enable_caching'],
+			"entries": cache.zcard(cache.make_key(INDEX_KEY)),
+			"hits": hits,
+			"misses": misses,
+			"hit_rate": hits / (hits + misses) if hits + misses else 0
+		}
+
+	except Exception as e:
+		frappe.log_error(f"Error getting OCR cache stats: {str(e)}")
+		return {"status": "error", "message": str(e)}
\ No newline at end of file
@@ -0,0 +1,177 @@
+import numpy as np
+
+from document_archiver.config import TESSERACT_CONFIG
+
+CHAR_WHITELIST = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz.,!?@#$%^&*()_+-=[]{}|;:,.<>?/~` '
+
+# Engines are created lazily and kept for the life of the process, one per
+# (language, psm, oem). The OCR pool lives for one batch job, so each pool
+# worker loads a language model once per batch rather than once per image;
+# batches are sized (ocr_batch_size) so that this warm-up is amortized.
+_engines = {}
+
+# Tesseract page segmentation mode for orientation and script detection only
+OSD_ONLY = 0
+
+class PytesseractEngine:
+	"""Fallback engine: runs the tesseract CLI through pytesseract for every image"""
+	name = "pytesseract"
+
+	def __init__(self, language, psm, oem):
+		self.language = language
+		self.config = f"--psm {psm} --oem {oem}"
+
+	def recognize(self, image, char_whitelist=None, timeout=0):
+		import pytesseract
+
+		config = self.config
+		if char_whitelist:
+			config += f" -c tessedit_char_whitelist={char_whitelist}"
+		return pytesseract.image_to_string(image, lang=self.language, config=config, timeout=timeout)
+
+	def recognize_words(self, image, char_whitelist=None, timeout=0):
+		import pytesseract
+
+		config = self.config
+		if char_whitelist:
+			config += f" -c tessedit_char_whitelist={char_whitelist}"
+		data = pytesseract.image_to_data(image, lang=self.language, config=config, timeout=timeout,
+										 output_type=pytesseract.Output.DICT)
+
+		words, lines = [], {}
+		for i, word in enumerate(data['text']):
+			if not word.strip():
+				continue
+			words.append((data['left'][i], data['top'][i], data['width'][i], data['height'][i], word))
+			lines.setdefault((data['block_num'][i], data['par_num'][i], data['line_num'][i]), []).append(word)
+
+		# Lay the text out as image_to_string does: a blank line between paragraphs
+		text, previous = [], None
+		for (block, paragraph, line), line_words in lines.items():
+			if previous and previous != (block, paragraph):
+				text.append("")
+			text.append(" ".join(line_words))
+			previous = (block, paragraph)
+		return "\n".join(text), words
+
+	def detect_rotation(self, image):
+		import pytesseract
+
+		return pytesseract.image_to_osd(image, output_type=pytesseract.Output.DICT)['rotate']
+
+	def close(self):
+		pass
+
+class TesserocrEngine:
+	"""In-process engine backed by the tesseract C API, fed with raw pixel buffers"""
+	name = "tesserocr"
+
+	def __init__(self, language, psm, oem):
+		import tesserocr
+
+		self.api = tesserocr.PyTessBaseAPI(lang=language, psm=psm, oem=oem)
+
+	def set_image(self, image):
+		pixels = np.ascontiguousarray(image)
+		height, width = pixels.shape[:2]
+		bytes_per_pixel = 1 if pixels.ndim == 2 else pixels.shape[2]
+		self.api.SetImageBytes(pixels.tobytes(), width, height, bytes_per_pixel, bytes_per_pixel * width)
+
+	def run_recognition(self, timeout):
+		"""Recognize the current image within timeout seconds (0: no limit), as pytesseract would"""
+		# Tesseract's own monitor cancels the page; the results are then read without recognizing again
+		if not self.api.Recognize(int(timeout * 1000)):
+			raise RuntimeError("Tesseract process timeout")
+
+	def recognize(self, image, char_whitelist=None, timeout=0):
+		self.api.SetVariable("tessedit_char_whitelist", char_whitelist or "")
+		self.set_image(image)
+		try:
+			self.run_recognition(timeout)
+			return self.api.GetUTF8Text()
+		finally:
+			self.api.Clear()
+
+	def recognize_words(self, image, char_whitelist=None, timeout=0):
+		from tesserocr import RIL, iterate_level
+
+		self.api.SetVariable("tessedit_char_whitelist", char_whitelist or "")
+		self.set_image(image)
+		try:
+			self.run_recognition(timeout)
+			text = self.api.GetUTF8Text()
+			words = []
+			for word in iterate_level(self.api.GetIterator(), RIL.WORD):
+				value = word.GetUTF8Text(RIL.WORD)
+				box = word.BoundingBox(RIL.WORD)
+				if value and value.strip() and box:
+					left, top, right, bottom = box
+					words.append((left, top, right - left, bottom - top, value))
+			return text, words
+		finally:
+			self.api.Clear()
+
+	def detect_rotation(self, image):
+		self.set_image(image)
+		try:
+			orientation = self.api.DetectOrientationScript()
+		finally:
+			self.api.Clear()
+		# orient_deg is the counter-clockwise orientation of the text
+		return (360 - orientation['orient_deg']) % 360 if orientation else None
+
+	def close(self):
+		self.api.End()
+
+def get_engine(settings):
+	"""Get this process's engine for the given OCR settings"""
+	key = (settings['language'], settings['psm'], settings['oem'])
+	if key not in _engines:
+		_engines[key] = create_engine(*key)
+	return _engines[key]
+
+def create_engine(language, psm, oem):
+	"""Create the configured engine, falling back to pytesseract"""
+	engine = TESSERACT_CONFIG['engine']
+	if engine in ("auto", "tesserocr"):
+		try:
+			return TesserocrEngine(language, psm, oem)
+		except (ImportError, RuntimeError):
+			if engine == "tesserocr":
+				raise
+	return PytesseractEngine(language, psm, oem)
+
+def recognize(image, settings):
+	"""OCR a numpy or PIL image with the pooled engine"""
+	if not isinstance(image, np.ndarray):
+		image = np.asarray(image)
+
+	char_whitelist = CHAR_WHITELIST if settings['scan_quality'] == "Maximum" else None
+	return get_engine(settings).recognize(image, char_whitelist=char_whitelist, timeout=settings['timeout'])
+
+def recognize_words(image, settings):
+	"""OCR an image, returning the text and its word boxes as (left, top, width, height, word)"""
+	if not isinstance(image, np.ndarray):
+		image = np.asarray(image)
+
+	char_whitelist = CHAR_WHITELIST if settings['scan_quality'] == "Maximum" else None
+	return get_engine(settings).recognize_words(image, char_whitelist=char_whitelist, timeout=settings['timeout'])
+
+def detect_rotation(image):
+	"""Clockwise rotation in degrees that makes the text upright, None when unknown"""
+	try:
+		if "osd" not in _engines:
+			_engines["osd"] = create_engine("osd", OSD_ONLY, TESSERACT_CONFIG['oem_mode'])
+		return _engines["osd"].detect_rotation(image)
+	except Exception:
+		# OSD data is an optional tesseract package
+		return None
+
+def warm_up_engines(settings_list):
+	"""Pool initializer: load the language models each worker will need"""
+	for settings in settings_list:
+		try:
+			get_engine(settings)
+		except Exception:
+			# Surfaced again, with context, when the first page is recognized
+			pass
\ No newline at end of file
@@ -0,0 +1,76 @@
+import os
+
+from document_archiver.config import TESSERACT_CONFIG
+from document_archiver.ocr.engine import recognize_words
+from document_archiver.ocr.pdf import extract_text_from_pdf
+from document_archiver.ocr.preprocess import get_preprocess_settings, new_stats, preprocess_for_ocr
+from document_archiver.ocr.searchable import build_page_layer, get_image_dpi
+
+IMAGE_EXTENSIONS = ['.png', '.jpg', '.jpeg', '.tiff', '.bmp', '.webp']
+
+# Bump whenever a change to preprocessing or extraction alters OCR output
+PIPELINE_VERSION = 5
+
+# These functions run inside OCR worker processes, so they must not touch
+# frappe (no DB connection, no request context). Errors are raised and
+# logged by the caller.
+
+def get_ocr_settings(scan_quality=None, language=None):
+	"""Resolve the preprocessing and OCR settings for a scanned document"""
+	settings = get_preprocess_settings(scan_quality)
+	settings.update({
+		"language": language or TESSERACT_CONFIG['default_language'],
+		"psm": TESSERACT_CONFIG['psm_mode'],
+		"oem": TESSERACT_CONFIG['oem_mode'],
+		"timeout": TESSERACT_CONFIG['timeout'],
+	})
+	return settings
+
+def get_pipeline_settings(settings):
+	"""The settings that actually affect OCR output"""
+	return {
+		"version": PIPELINE_VERSION,
+		"branch": "otsu" if settings['scan_quality'] == "Draft" else "adaptive",
+		"whitelist": settings['scan_quality'] == "Maximum",
+		"denoise_strength": settings['denoise_strength'],
+		"threshold_block_size": settings['threshold_block_size'],
+		"threshold_c": settings['threshold_c'],
+		"auto_rotate": settings['auto_rotate'],
+		"auto_deskew": settings['auto_deskew'],
+		"auto_crop": settings['auto_crop'],
+		"language": settings['language'],
+		"psm": settings['psm'],
+		"oem": settings['oem'],
+	}
+
+def is_pdf(file_path):
+	"""Check whether a file on disk is a PDF"""
+	return os.path.splitext(file_path)[1].lower() == '.pdf'
+
+def extract_text(file_path, settings, executor=None, stats=None):
+	"""Extract text from an image or PDF file on disk"""
+	file_extension = os.path.splitext(file_path)[1].lower()
+
+	if file_extension in IMAGE_EXTENSIONS:
+		return extract_text_from_image(file_path, settings, stats)
+	elif file_extension == '.pdf':
+		return extract_text_from_pdf(file_path, settings, executor, stats)
+	else:
+		return ""
+
+def extract_page_with_stats(image_path, settings, dpi=None):
+	"""Pool entry point for images: text, preprocessing stats and the searchable PDF page"""
+	stats = new_stats()
+	text, layer = extract_image_page(image_path, settings, stats, dpi)
+	return text, stats, layer
+
+def extract_text_from_image(image_path, settings, stats=None):
+	"""Extract text from image using OCR"""
+	return extract_image_page(image_path, settings, stats)[0]
+
+def extract_image_page(image_path, settings, stats=None, dpi=None):
+	"""OCR an image, returning its text and searchable PDF page layer"""
+	# Page size: the DPI stored in the file, else the row's scan resolution, else pdf_dpi
+	pixels = preprocess_for_ocr(image_path, settings, stats)
+	text, words = recognize_words(pixels, settings)
+	return text.strip(), build_page_layer(pixels, words, get_image_dpi(image_path) or dpi)
\ No newline at end of file
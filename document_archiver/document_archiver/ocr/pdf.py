@@ -0,0 +1,80 @@
+from collections import deque
+import subprocess
+
+from document_archiver.config import FILE_PROCESSING, PERFORMANCE_CONFIG
+from document_archiver.ocr.engine import recognize
+from document_archiver.ocr.preprocess import merge_stats, new_stats, preprocess_for_ocr
+
+# Pages that carry a text layer are read directly; the rest are rendered one
+# page at a time, so peak memory depends on the number of pages in flight
+# rather than on the length of the document.
+
+def get_pdf_page_count(pdf_path):
+	"""Read the number of pages from the PDF header"""
+	from pdf2image import pdfinfo_from_path
+
+	return int(pdfinfo_from_path(pdf_path)["Pages"])
+
+def extract_text_layer(pdf_path, page_count, timeout=None):
+	"""Read the embedded text of each page, None for pages that need OCR"""
+	try:
+		result = subprocess.run(['pdftotext', '-enc', 'UTF-8', pdf_path, '-'],
+								capture_output=True, timeout=timeout, check=True)
+	except (FileNotFoundError, subprocess.SubprocessError):
+		return [None] * page_count
+
+	# pdftotext ends every page with a form feed
+	texts = result.stdout.decode('utf-8', errors='replace').split('\f')[:page_count]
+	texts += [""] * (page_count - len(texts))
+
+	min_chars = FILE_PROCESSING['pdf_text_layer_min_chars']
+	return [text if len("".join(text.split())) >= min_chars else None for text in texts]
+
+def render_pdf_page(pdf_path, page_number, dpi=None, grayscale=True):
+	"""Rasterize a single PDF page to a PIL image, grayscale unless asked otherwise"""
+	from pdf2image import convert_from_path
+
+	images = convert_from_path(pdf_path, dpi=dpi or FILE_PROCESSING['pdf_dpi'],
+							   first_page=page_number, last_page=page_number,
+							   grayscale=grayscale)
+	return images[0]
+
+def ocr_pdf_page(pdf_path, page_number, settings):
+	"""Render, preprocess and OCR one page of a PDF; returns (text, stats)"""
+	stats = new_stats()
+	image = render_pdf_page(pdf_path, page_number)
+	try:
+		pixels = preprocess_for_ocr(image, settings, stats)
+	finally:
+		image.close()
+	return recognize(pixels, settings), stats
+
+def extract_text_from_pdf(pdf_path, settings, executor=None, stats=None):
+	"""Extract text from PDF, OCR-ing only pages without a text layer"""
+	page_count = get_pdf_page_count(pdf_path)
+	pages = extract_text_layer(pdf_path, page_count, timeout=settings['timeout'])
+	ocr_pages = [page_number for page_number, text in enumerate(pages, 1) if text is None]
+
+	def collect(page_number, result):
+		pages[page_number - 1], page_stats = result
+		if stats is not None:
+			merge_stats(stats, page_stats)
+
+	if executor is None:
+		for page_number in ocr_pages:
+			collect(page_number, ocr_pdf_page(pdf_path, page_number, settings))
+	else:
+		in_flight = deque()
+		window = PERFORMANCE_CONFIG['pdf_page_window']
+
+		for page_number in ocr_pages:
+			if len(in_flight) >= window:
+				done_page, future = in_flight.popleft()
+				collect(done_page, future.result())
+			in_flight.append((page_number, executor.submit(ocr_pdf_page, pdf_path, page_number, settings)))
+
+		while in_flight:
+			done_page, future = in_flight.popleft()
+			collect(done_page, future.result())
+
+	return "\n".join(pages).strip()
\ No newline at end of file
@@ -0,0 +1,338 @@
+import cv2
+import math
+import numpy as np
+import time
+from collections import Counter
+
+from document_archiver.config import FILE_PROCESSING
+
+# Image preprocessing shared by every OCR and capture entry point. A pipeline
+# is a list of (name, stage) pairs; each stage takes the current numpy buffer,
+# the settings dict and an optional stats dict, and returns the buffer to hand
+# to the next stage. Stages write into their input buffer wherever OpenCV
+# allows it, so a page is decoded once and not copied between stages.
+
+SHARPEN_KERNEL = np.array([[-1, -1, -1], [-1, 9, -1], [-1, -1, -1]])
+
+# Second-difference kernel used to estimate noise; its L2 norm is 6
+NOISE_KERNEL = np.array([[1, -2, 1], [-2, 4, -2], [1, -2, 1]], dtype=np.float32)
+
+# Pixels sampled along the longest side when estimating noise
+NOISE_SAMPLE_SIZE = 1024
+
+# A page is treated as sideways when its column ink profile is this much
+# sharper than its row profile
+SIDEWAYS_RATIO = 2.0
+
+# Skew below this many degrees is left alone
+MIN_SKEW_ANGLE = 0.2
+
+# Ink pixels projected per candidate angle when estimating skew
+SKEW_SAMPLE_POINTS = 20000
+
+# Coarse-to-fine skew search: (step, half-width) in degrees after the first pass
+SKEW_REFINE_STEPS = ((0.5, 1.5), (0.1, 0.4))
+
+# Longest side, in pixels, of the page handed to OSD
+OSD_MAX_SIZE = 1600
+
+# The bright page region must cover this share of the scan to be cropped to
+MIN_PAGE_AREA = 0.2
+
+# Margin kept around the detected text, as a share of the page size
+CROP_MARGIN = 0.02
+
+def get_preprocess_settings(scan_quality=None):
+	"""Preprocessing parameters from FILE_PROCESSING for a scan quality"""
+	return {
+		"scan_quality": scan_quality or "High",
+		"denoise_strength": FILE_PROCESSING['denoise_strength'],
+		"color_denoise_strength": FILE_PROCESSING['color_denoise_strength'],
+		"noise_skip_below": FILE_PROCESSING['noise_skip_below'],
+		"noise_full_above": FILE_PROCESSING['noise_full_above'],
+		"threshold_block_size": FILE_PROCESSING['threshold_block_size'],
+		"threshold_c": FILE_PROCESSING['threshold_c'],
+		"auto_rotate": FILE_PROCESSING['auto_rotate'],
+		"auto_deskew": FILE_PROCESSING['auto_deskew'],
+		"auto_crop": FILE_PROCESSING['auto_crop'],
+		"geometry_proxy_size": FILE_PROCESSING['geometry_proxy_size'],
+		"max_skew_angle": FILE_PROCESSING['max_skew_angle'],
+	}
+
+def decode(source, grayscale=True):
+	"""Load a path, encoded bytes, PIL image or array into a writable numpy buffer"""
+	flags = cv2.IMREAD_GRAYSCALE if grayscale else cv2.IMREAD_COLOR
+
+	if isinstance(source, np.ndarray):
+		image = source
+	elif isinstance(source, str):
+		image = cv2.imread(source, flags)
+	elif isinstance(source, (bytes, bytearray, memoryview)):
+		image = cv2.imdecode(np.frombuffer(source, np.uint8), flags)
+	else:
+		# PIL buffers are read-only, so this is the one copy we need
+		image = np.array(source)
+
+	if image is None:
+		raise ValueError("Unable to decode image")
+	return image
+
+def new_stats():
+	"""Empty preprocessing stats: per-stage milliseconds, denoise and geometry decisions"""
+	return {"timings": Counter(), "denoise": Counter(), "geometry": Counter(), "pages": 0}
+
+def merge_stats(stats, other):
+	"""Add the counters of other into stats"""
+	stats["timings"].update(other["timings"])
+	stats["denoise"].update(other["denoise"])
+	stats["geometry"].update(other["geometry"])
+	stats["pages"] += other["pages"]
+	return stats
+
+def estimate_noise(image):
+	"""Estimate the noise sigma of a grayscale buffer on a strided sample"""
+	# Median absolute response of a second-difference filter: the sparse,
+	# strong edges of text strokes do not move the median
+	step = max(1, math.ceil(max(image.shape[:2]) / NOISE_SAMPLE_SIZE))
+	sample = np.ascontiguousarray(image[::step, ::step], dtype=np.float32)
+	response = cv2.filter2D(sample, -1, NOISE_KERNEL)[1:-1, 1:-1]
+	return float(np.median(np.abs(response))) / (0.6745 * 6)
+
+def to_grayscale(image, settings, stats=None):
+	"""Convert a BGR buffer to single channel"""
+	if image.ndim == 2:
+		return image
+	return cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+
+def to_rgb(image, settings, stats=None):
+	"""Convert a BGR buffer to RGB in place"""
+	if image.ndim == 2:
+		return image
+	return cv2.cvtColor(image, cv2.COLOR_BGR2RGB, dst=image)
+
+def make_proxy(image, size):
+	"""Downscale a grayscale buffer so its longest side is at most size; returns (proxy, scale)"""
+	scale = min(1.0, size / max(image.shape[:2]))
+	if scale == 1.0:
+		return image, scale
+	return cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA), scale
+
+def binarize_ink(gray):
+	"""Otsu mask with ink as 255 and paper as 0"""
+	return cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)[1]
+
+def profile_score(ink):
+	"""Variance of the row ink profile; it peaks when text lines are horizontal"""
+	return float(np.var(cv2.reduce(ink, 1, cv2.REDUCE_AVG, dtype=cv2.CV_32F)))
+
+def rotate_about_center(image, angle, border_value=0, flags=cv2.INTER_NEAREST):
+	"""Rotate counter-clockwise by angle degrees, keeping the buffer size"""
+	height, width = image.shape[:2]
+	matrix = cv2.getRotationMatrix2D((width / 2, height / 2), angle, 1.0)
+	return cv2.warpAffine(image, matrix, (width, height), flags=flags, borderValue=border_value)
+
+def find_quarter_turns(image, ink):
+	"""Clockwise quarter turns that make the text upright"""
+	if profile_score(ink.T) < SIDEWAYS_RATIO * profile_score(ink):
+		return 0
+
+	# The ink profile only tells sideways from upright; OSD picks the direction
+	from document_archiver.ocr.engine import detect_rotation
+
+	rotation = detect_rotation(make_proxy(image, OSD_MAX_SIZE)[0])
+	return 1 if rotation is None else round(rotation / 90) % 4
+
+def find_skew(ink, max_angle):
+	"""Angle in degrees that maximises the row profile of the projected ink pixels"""
+	points = cv2.findNonZero(ink)
+	if points is None:
+		return 0.0
+
+	# Projecting the ink coordinates is equivalent to rotating the mask and
+	# reducing its rows, without a warp per candidate angle
+	points = points.reshape(-1, 2)[::math.ceil(len(points) / SKEW_SAMPLE_POINTS)].astype(np.float32)
+	height, width = ink.shape[:2]
+	x = points[:, 0] - width / 2
+	y = points[:, 1] - height / 2
+	offset = math.hypot(width, height) / 2
+
+	def score(angle):
+		radians = math.radians(angle)
+		rows = (y * math.cos(radians) - x * math.sin(radians) + offset).astype(np.int32)
+		counts = np.bincount(rows).astype(np.int64)
+		return int(np.dot(counts, counts))
+
+	def best(angles):
+		return float(max(angles, key=score))
+
+	angle = best(np.arange(-max_angle, max_angle + 1, 2.0))
+	for step, span in SKEW_REFINE_STEPS:
+		angle = best(np.arange(angle - span, angle + span + step / 2, step))
+	return angle
+
+def find_crop(gray):
+	"""Bounding box (x, y, w, h) of the text on the page, None when nothing is worth cropping"""
+	height, width = gray.shape
+	x, y, w, h = 0, 0, width, height
+
+	# A dark scanner lid or desk around the page shows up as one large bright contour
+	paper = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)[1]
+	contours = cv2.findContours(paper, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)[-2]
+	if contours:
+		page = max(contours, key=cv2.contourArea)
+		if cv2.contourArea(page) >= MIN_PAGE_AREA * width * height:
+			x, y, w, h = cv2.boundingRect(page)
+			inset_x, inset_y = int(w * CROP_MARGIN / 2), int(h * CROP_MARGIN / 2)
+			x, y, w, h = x + inset_x, y + inset_y, w - 2 * inset_x, h - 2 * inset_y
+
+	# Opening drops dust and speckle so they do not stretch the text box
+	ink = cv2.morphologyEx(binarize_ink(gray[y:y + h, x:x + w]), cv2.MORPH_OPEN, np.ones((3, 3), np.uint8))
+	points = cv2.findNonZero(ink)
+	if points is None:
+		return None
+
+	ink_x, ink_y, ink_w, ink_h = cv2.boundingRect(points)
+	margin_x, margin_y = int(w * CROP_MARGIN), int(h * CROP_MARGIN)
+	left, top = max(x + ink_x - margin_x, 0), max(y + ink_y - margin_y, 0)
+	right = min(x + ink_x + ink_w + margin_x, width)
+	bottom = min(y + ink_y + ink_h + margin_y, height)
+
+	if (right - left) * (bottom - top) >= 0.98 * width * height:
+		return None
+	return left, top, right - left, bottom - top
+
+def correct_geometry(image, settings, stats=None):
+	"""Auto-rotate, deskew and crop a grayscale page in a single warp
+
+	Rotation, skew and crop box are estimated on a small proxy and only the
+	final transform is applied at full resolution."""
+	if not (settings['auto_rotate'] or settings['auto_deskew'] or settings['auto_crop']):
+		return image
+
+	proxy, scale = make_proxy(image, settings['geometry_proxy_size'])
+	ink = binarize_ink(proxy)
+	turns, angle, crop = 0, 0.0, None
+
+	if settings['auto_rotate']:
+		turns = find_quarter_turns(image, ink)
+		if turns:
+			proxy = np.rot90(proxy, -turns)
+			ink = np.ascontiguousarray(np.rot90(ink, -turns))
+
+	if settings['auto_deskew']:
+		angle = find_skew(ink, settings['max_skew_angle'])
+		if abs(angle) < MIN_SKEW_ANGLE:
+			angle = 0.0
+		elif settings['auto_crop']:
+			proxy = rotate_about_center(np.ascontiguousarray(proxy), angle, flags=cv2.INTER_LINEAR,
+										border_value=255)
+
+	if settings['auto_crop']:
+		crop = find_crop(np.ascontiguousarray(proxy))
+
+	if stats is not None:
+		for decision, applied in (("rotated", turns), ("deskewed", angle), ("cropped", crop)):
+			if applied:
+				stats["geometry"][decision] += 1
+
+	height, width = image.shape[:2]
+	if turns % 2:
+		width, height = height, width
+
+	if crop:
+		# Map the proxy box back to full resolution
+		x, y, w, h = (int(round(value / scale)) for value in crop)
+		w, h = min(w, width - x), min(h, height - y)
+	else:
+		x, y, w, h = 0, 0, width, height
+
+	if not turns and not angle:
+		# A plain crop is a view, no pixels are copied
+		return image[y:y + h, x:x + w] if crop else image
+
+	# Compose quarter turn, deskew and crop into one affine transform
+	source_height, source_width = image.shape[:2]
+	quarter = cv2.getRotationMatrix2D((0, 0), -90 * turns, 1.0)
+	corners = quarter[:, :2] @ np.array([[0, source_width - 1], [0, source_height - 1]])
+	quarter[:, 2] = -corners.min(axis=1)
+
+	deskew = cv2.getRotationMatrix2D((width / 2, height / 2), angle, 1.0)
+	translate = np.array([[1, 0, -x], [0, 1, -y], [0, 0, 1]], dtype=np.float64)
+	matrix = translate @ np.vstack([deskew, [0, 0, 1]]) @ np.vstack([quarter, [0, 0, 1]])
+
+	return cv2.warpAffine(image, matrix[:2], (w, h), flags=cv2.INTER_LINEAR, borderValue=255)
+
+def denoise(image, settings, stats=None):
+	"""Skip, filter cheaply or fully denoise depending on the estimated noise"""
+	gray = image if image.ndim == 2 else cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+	sigma = estimate_noise(gray)
+
+	if sigma < settings['noise_skip_below']:
+		mode = "none"
+	elif sigma < settings['noise_full_above']:
+		mode = "fast"
+		if image.ndim == 2:
+			image = cv2.medianBlur(image, 3)
+		else:
+			image = cv2.bilateralFilter(image, 5, 50, 50)
+	else:
+		mode = "nlmeans"
+		if image.ndim == 2:
+			image = cv2.fastNlMeansDenoising(image, None, settings['denoise_strength'])
+		else:
+			strength = settings['color_denoise_strength']
+			image = cv2.fastNlMeansDenoisingColored(image, None, strength, strength, 7, 21)
+
+	if stats is not None:
+		stats["denoise"][mode] += 1
+	return image
+
+def threshold(image, settings, stats=None):
+	"""Binarize in place: Otsu for drafts, adaptive Gaussian otherwise"""
+	if settings['scan_quality'] == "Draft":
+		cv2.threshold(image, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU, dst=image)
+	else:
+		cv2.adaptiveThreshold(image, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY,
+							  settings['threshold_block_size'], settings['threshold_c'], dst=image)
+	return image
+
+def sharpen(image, settings, stats=None):
+	"""Sharpen in place with a 3x3 kernel"""
+	return cv2.filter2D(image, -1, SHARPEN_KERNEL, dst=image)
+
+def build_ocr_pipeline(settings):
+	"""Stages applied to every page before OCR"""
+	return [
+		("grayscale", to_grayscale),
+		("geometry", correct_geometry),
+		("denoise", denoise),
+		("threshold", threshold),
+	]
+
+def build_capture_pipeline(settings):
+	"""Stages applied to camera frames before they are stored"""
+	stages = [("rgb", to_rgb)]
+	if settings['scan_quality'] == "Maximum":
+		stages += [("denoise", denoise), ("sharpen", sharpen)]
+	return stages
+
+def run_pipeline(image, stages, settings, stats=None):
+	"""Pass a buffer through each stage in order, timing stages into stats"""
+	for name, stage in stages:
+		started = time.perf_counter()
+		image = stage(image, settings, stats)
+		if stats is not None:
+			stats["timings"][name] += (time.perf_counter() - started) * 1000
+
+	if stats is not None:
+		stats["pages"] += 1
+	return image
+
+def preprocess_for_ocr(source, settings, stats=None):
+	"""Decode and prepare an image for OCR"""
+	started = time.perf_counter()
+	image = decode(source)
+	if stats is not None:
+		stats["timings"]["decode"] += (time.perf_counter() - started) * 1000
+
+	return run_pipeline(image, build_ocr_pipeline(settings), settings, stats)
\ No newline at end of file
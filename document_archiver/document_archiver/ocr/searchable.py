@@ -0,0 +1,62 @@
+import numpy as np
+import zlib
+
+from document_archiver.config import FILE_PROCESSING
+
+# Builds the pieces of one searchable PDF page from an OCR'd image: the
+# binarized page as a 1-bit image and a content stream that draws it with the
+# recognized words on top in invisible text (render mode 3). Runs in the OCR
+# worker processes, so it must not touch frappe.
+
+# Advance width of every glyph of the glyphless text font, in 1/1000 em
+GLYPH_WIDTH = 500
+
+# Below this, embedded DPI is a screen default (72, 96) rather than a scan resolution
+MIN_SCAN_DPI = 100
+
+def get_image_dpi(image_path):
+	"""Horizontal resolution recorded in an image file, None when absent or implausible"""
+	from PIL import Image
+
+	try:
+		# Only the header is read
+		with Image.open(image_path) as image:
+			dpi = image.info.get("dpi")
+	except Exception:
+		return None
+	return float(dpi[0]) if dpi and dpi[0] >= MIN_SCAN_DPI else None
+
+def encode_word(word):
+	"""Hex of a word in the Identity-H encoding, i.e. its UTF-16BE code units"""
+	# Characters outside the basic plane would need surrogate pairs
+	word = "".join(char if ord(char) <= 0xFFFF else "?" for char in word)
+	return word.encode("utf-16-be").hex()
+
+def build_page_layer(image, words, dpi=None):
+	"""Image and content streams of an OCR'd page at dpi, ready to be appended to an archive PDF"""
+	dpi = dpi or FILE_PROCESSING['pdf_dpi']
+	scale = 72 / dpi
+	height, width = image.shape[:2]
+	page_width, page_height = width * scale, height * scale
+
+	content = [f"q {page_width:.2f} 0 0 {page_height:.2f} 0 0 cm /Im0 Do Q", "BT 3 Tr"]
+	for left, top, box_width, box_height, word in words:
+		if not word or box_width <= 0 or box_height <= 0:
+			continue
+		encoded = encode_word(word)
+		font_size = box_height * scale
+		# Stretch the text horizontally so a selection covers the word on the image
+		stretch = 100 * box_width * scale / (len(encoded) / 4 * font_size * GLYPH_WIDTH / 1000)
+		x, y = left * scale, page_height - (top + box_height) * scale
+		content.append(f"/F0 {font_size:.2f} Tf {stretch:.2f} Tz 1 0 0 1 {x:.2f} {y:.2f} Tm <{encoded}> Tj")
+	content.append("ET")
+
+	return {
+		"width": width,
+		"height": height,
+		"page_width": page_width,
+		"page_height": page_height,
+		# One bit per pixel, a set bit being white; rows are padded to whole bytes
+		"image": zlib.compress(np.packbits(image > 127, axis=1).tobytes()),
+		"content": zlib.compress("\n".join(content).encode("ascii")),
+	}
\ No newline at end of file
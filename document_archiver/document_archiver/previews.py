@@ -0,0 +1,168 @@
+import frappe
+import os
+from frappe.utils import cint
+from PIL import Image, ImageOps
+
+from document_archiver.api.response_cache import invalidate_archive
+from document_archiver.config import PERFORMANCE_CONFIG, PREVIEW_CONFIG
+from document_archiver.encoding import to_8bit
+from document_archiver.files import get_file_paths
+from document_archiver.ocr.cache import hash_file
+from document_archiver.ocr.extract import is_pdf
+from document_archiver.ocr.pdf import render_pdf_page
+
+# Preview pyramid of every scanned page: thumbnail, screen and full size
+# WebP renditions, built once in the background from the largest down.
+# Files are named after the content hash and size of the source, so their
+# URLs never change meaning and can be cached by clients and proxies
+# indefinitely; identical uploads share one set of previews. Previews of a
+# private file are private too, and are registered as File records attached
+# like their page, so they are served with the same permission checks.
+#
+# A row is queued once: preview_status records that it was queued, built or
+# failed, and only a new attachment clears it.
+
+def enqueue_previews(scanned_document_names):
+	"""Queue preview generation for the given Scanned Document rows"""
+	names = list(dict.fromkeys(name for name in scanned_document_names if name))
+	batch_size = PERFORMANCE_CONFIG['batch_processing_size']
+	if not names:
+		return
+
+	frappe.db.sql("""
+		UPDATE `tabScanned Document`
+		SET preview_status = 'Queued'
+		WHERE name IN %s
+	""", (tuple(names),))
+
+	for start in range(0, len(names), batch_size):
+		frappe.enqueue(
+			"document_archiver.previews.generate_previews",
+			queue="short",
+			enqueue_after_commit=True,
+			scanned_document_names=names[start:start + batch_size]
+		)
+
+def generate_previews(scanned_document_names):
+	"""Background job: build the preview pyramid of each scanned page"""
+	rows = frappe.get_all("Scanned Document",
+						  filters={"name": ["in", scanned_document_names]},
+						  fields=["name", "parent", "parenttype", "file_attachment"])
+
+	paths = get_file_paths([row.file_attachment for row in rows])
+	for row in rows:
+		if not row.file_attachment:
+			continue
+		try:
+			if row.file_attachment not in paths:
+				raise frappe.DoesNotExistError(f"File {row.file_attachment} not found")
+			private = row.file_attachment.startswith("/private/")
+			urls = build_previews(paths[row.file_attachment], private)
+			if private:
+				register_private_previews(row, urls)
+		except Exception as e:
+			frappe.log_error(f"Error generating previews for {row.name}: {str(e)}")
+			# Not retried on later saves or polls; a new attachment queues the row again
+			frappe.db.set_value("Scanned Document", row.name, "preview_status", "Failed", update_modified=False)
+			frappe.db.commit()
+			continue
+
+		values = {f"preview_{size}": url for size, url in urls.items()}
+		values["preview_status"] = "Completed"
+		frappe.db.set_value("Scanned Document", row.name, values, update_modified=False)
+		frappe.db.commit()
+		if row.parenttype == "Document Archive":
+			invalidate_archive(row.parent)
+
+def build_previews(path, private=False):
+	"""Write the previews of a file unless they exist; returns {size name: URL}"""
+	content_hash = hash_file(path)
+	folder = PREVIEW_CONFIG['folder']
+	root = ("private", "files") if private else ("public", "files")
+	os.makedirs(frappe.get_site_path(*root, folder), exist_ok=True)
+
+	# Largest first, so each size is downscaled from the one before it
+	sizes = sorted(PREVIEW_CONFIG['sizes'].items(), key=lambda item: item[1], reverse=True)
+	files = {name: f"{folder}/{content_hash}_{size}.webp" for name, size in sizes}
+	url_prefix = "/private/files" if private else "/files"
+	urls = {name: f"{url_prefix}/{file_name}" for name, file_name in files.items()}
+	if all(os.path.exists(frappe.get_site_path(*root, file_name)) for file_name in files.values()):
+		return urls
+
+	image = load_preview_source(path, sizes[0][1])
+	try:
+		for name, size in sizes:
+			image.thumbnail((size, size), Image.Resampling.LANCZOS, reducing_gap=3.0)
+			image.save(frappe.get_site_path(*root, files[name]), format="WEBP",
+					   quality=PREVIEW_CONFIG['quality'])
+	finally:
+		image.close()
+	return urls
+
+def register_private_previews(row, urls):
+	"""Attach private previews like their page, so /private/files serves them to the same users"""
+	# Identical private uploads share the preview files, with one File record per attachment
+	attached_to = (row.parenttype, row.parent) if row.parenttype else ("Scanned Document", row.name)
+	for url in urls.values():
+		if frappe.db.exists("File", {"file_url": url, "attached_to_doctype": attached_to[0],
+									 "attached_to_name": attached_to[1]}):
+			continue
+		frappe.get_doc({
+			"doctype": "File",
+			"file_name": os.path.basename(url),
+			"file_url": url,
+			"is_private": 1,
+			"attached_to_doctype": attached_to[0],
+			"attached_to_name": attached_to[1]
+		}).insert(ignore_permissions=True)
+
+def load_preview_source(path, max_size):
+	"""Open the first page of an image or PDF as an 8-bit RGB or grayscale PIL image"""
+	if is_pdf(path):
+		image = render_pdf_page(path, 1, dpi=PREVIEW_CONFIG['pdf_dpi'], grayscale=False)
+	else:
+		image = Image.open(path)
+		# JPEG can decode at 1/2, 1/4 or 1/8 scale, which is much faster
+		image.draft("RGB", (max_size, max_size))
+		image = ImageOps.exif_transpose(image)
+
+	image = to_8bit(image)
+	if image.mode == "1":
+		image = image.convert("L")
+	elif image.mode not in ("L", "RGB", "RGBA"):
+		image = image.convert("RGB")
+	return image
+
+@frappe.whitelist()
+def get_preview_url(scanned_document, size="thumbnail", width=None):
+	"""URL of a page preview by size name, or by the smallest size covering width pixels"""
+	try:
+		sizes = PREVIEW_CONFIG['sizes']
+		if width:
+			fitting = [name for name, pixels in sizes.items() if pixels >= cint(width)]
+			size = min(fitting, key=sizes.get) if fitting else max(sizes, key=sizes.get)
+		if size not in sizes:
+			return {"status": "error", "message": f"Unknown preview size: {size}"}
+
+		row = frappe.db.get_value("Scanned Document", scanned_document,
+								  ["parent", "parenttype", "file_attachment", "preview_status", f"preview_{size}"], as_dict=True)
+		if not row:
+			return {"status": "error", "message": "Scanned document not found"}
+		if row.parenttype == "Document Archive" and not frappe.has_permission("Document Archive", "read", row.parent):
+			return {"status": "error", "message": "Not permitted"}
+
+		url = row[f"preview_{size}"]
+		if not url and row.file_attachment and not row.preview_status:
+			enqueue_previews([scanned_document])
+
+		return {
+			"status": "success",
+			"size": size,
+			"url": url or row.file_attachment,
+			"ready": bool(url),
+			"preview_status": row.preview_status
+		}
+
+	except Exception as e:
+		frappe.log_error(f"Error getting preview URL: {str(e)}")
+		return {"status": "error", "message": str(e)}
\ No newline at end of file
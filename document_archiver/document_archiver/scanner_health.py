@@ -0,0 +1,105 @@
+import frappe
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from document_archiver.config import SCANNER_CONFIG
+
+# Scanner health is probed in the background and read from the cache.
+# Probes for different devices run concurrently on a thread pool, each
+# bounded by a deadline, and configs sharing a device are probed once. The
+# probe functions only shell out or open the camera, so they are safe to
+# run off the request thread without a frappe context; anything that needs
+# frappe, like the shared webcam session flag, is read before submitting.
+
+HEALTH_KEY = "document_archiver:scanner_health"
+REFRESH_LOCK_KEY = f"{HEALTH_KEY}:refreshing"
+QUEUED_KEY = f"{HEALTH_KEY}:queued"
+
+def get_probe_key(scanner):
+	"""Scanner configs pointing at the same device share one probe"""
+	if scanner.scanner_type == "Webcam":
+		# Every webcam probe opens device 0, and concurrent opens would clash
+		return ("Webcam", 0)
+	return (scanner.scanner_type, scanner.device_id or "default")
+
+def probe(scanner, timeout, webcam_in_use=False):
+	"""Run the connection test for one scanner; must not touch frappe"""
+	from document_archiver.api.scanner import test_sane_scanner, test_twain_scanner, test_webcam_scanner
+
+	if scanner.scanner_type == "SANE":
+		return test_sane_scanner(scanner, timeout=timeout)
+	elif scanner.scanner_type == "Webcam":
+		return test_webcam_scanner(scanner, session_open=webcam_in_use)
+	elif scanner.scanner_type == "TWAIN":
+		return test_twain_scanner(scanner)
+	return {"status": "error", "message": "Unsupported scanner type"}
+
+def probe_scanners(scanners):
+	"""Probe scanners concurrently; returns {config name: status} with check timestamps"""
+	settings = SCANNER_CONFIG['health']
+	timeout = settings['probe_timeout']
+
+	devices = {}
+	for scanner in scanners:
+		devices.setdefault(get_probe_key(scanner), scanner)
+
+	# Read on this thread: pool threads have no frappe.local for the cache
+	webcam_in_use = False
+	if ("Webcam", 0) in devices:
+		from document_archiver.webcam import is_session_open
+		webcam_in_use = is_session_open(0)
+
+	executor = ThreadPoolExecutor(max_workers=max(1, min(settings['max_workers'], len(devices))))
+	try:
+		futures = {key: executor.submit(probe, scanner, timeout, webcam_in_use) for key, scanner in devices.items()}
+		# The SANE probe stops itself at the deadline; this also bounds camera opens that hang
+		wait(futures.values(), timeout=timeout + 1)
+	finally:
+		executor.shutdown(wait=False)
+
+	checked_at = frappe.utils.now()
+	results = {}
+	for key, future in futures.items():
+		if not future.done():
+			result = {"status": "error", "message": f"No response within {timeout} seconds"}
+		elif future.exception():
+			result = {"status": "error", "message": str(future.exception())}
+		else:
+			result = future.result()
+		results[key] = dict(result, checked_at=checked_at)
+
+	return {scanner.name: results[get_probe_key(scanner)] for scanner in scanners}
+
+def refresh_scanner_health(force=False):
+	"""Scheduler: probe every active scanner and cache the results once they are stale"""
+	cache = frappe.cache()
+	# A SANE probe is a real test scan, so busy feeders are not probed every tick
+	if not force and not is_stale(cache.get_value(HEALTH_KEY)):
+		cache.delete_value(QUEUED_KEY)
+		return
+	if cache.get_value(REFRESH_LOCK_KEY):
+		return
+	cache.set_value(REFRESH_LOCK_KEY, 1, expires_in_sec=SCANNER_CONFIG['health']['probe_timeout'] * 2)
+
+	try:
+		scanners = frappe.get_all("Scanner Config",
+								  filters={"is_active": 1},
+								  fields=["name", "scanner_type", "device_id"])
+		health = probe_scanners(scanners)
+		cache.set_value(HEALTH_KEY, {"refreshed_at": time.time(), "scanners": health})
+	finally:
+		cache.delete_value([REFRESH_LOCK_KEY, QUEUED_KEY])
+
+def get_scanner_health():
+	"""Cached {config name: status}; queues a refresh when the cache is missing or stale"""
+	cache = frappe.cache()
+	health = cache.get_value(HEALTH_KEY)
+	# One queued refresh at a time; the flag expires in case the job is lost
+	if is_stale(health) and not cache.get_value(QUEUED_KEY):
+		cache.set_value(QUEUED_KEY, 1, expires_in_sec=SCANNER_CONFIG['health']['probe_timeout'] * 4)
+		frappe.enqueue("document_archiver.scanner_health.refresh_scanner_health", queue="short")
+	return health["scanners"] if health else {}
+
+def is_stale(health):
+	"""Whether cached health is missing or older than stale_after"""
+	return not health or time.time() - health["refreshed_at"] > SCANNER_CONFIG['health']['stale_after']
\ No newline at end of file
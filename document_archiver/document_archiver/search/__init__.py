@@ -0,0 +1 @@
+# Search module for Document Archiver
\ No newline at end of file
@@ -0,0 +1,68 @@
+import frappe
+import math
+import time
+
+from document_archiver.config import SEARCH_CONFIG
+from document_archiver.search.index import get_idf, get_trigrams, rank_postings, tokenize
+
+# OCR-tolerant search: each query token is matched against the indexed
+# vocabulary by trigram similarity, and the matching terms are then ranked
+# through the regular postings. Candidates are pruned in SQL by shared
+# trigram count and term length, so no per-row edit distance is computed.
+
+def fuzzy_search(query, reference_doctype, limit=20, start=0):
+	"""Rank documents by similarity-weighted matches of the query tokens"""
+	deadline = time.monotonic() + SEARCH_CONFIG['fuzzy_time_budget_ms'] / 1000
+	term_similarity = {}
+
+	for token in dict.fromkeys(tokenize(query)):
+		if time.monotonic() > deadline:
+			# Out of budget: keep the token itself so it can still match exactly
+			term_similarity.setdefault(token, 1.0)
+			continue
+
+		for term, similarity in find_similar_terms(token).items():
+			term_similarity[term] = max(similarity, term_similarity.get(term, 0))
+
+	if not term_similarity:
+		return [], False
+
+	idf = get_idf(list(term_similarity))
+	if not idf:
+		return [], False
+
+	term_weights = {term: weight * term_similarity[term] for term, weight in idf.items()}
+	return rank_postings(term_weights, reference_doctype, limit, start)
+
+def find_similar_terms(token):
+	"""Vocabulary terms whose trigram (Jaccard) similarity to token meets the threshold"""
+	threshold = SEARCH_CONFIG['fuzzy_similarity_threshold']
+	trigrams = get_trigrams(token)
+
+	# Jaccard similarity >= threshold bounds both the shared trigrams and the term size.
+	# Shared trigrams are counted distinct: two jobs indexing a new term at once both insert its trigrams
+	min_shared = math.ceil(threshold * len(trigrams))
+	min_count = math.floor(threshold * len(trigrams))
+	max_count = math.ceil(len(trigrams) / threshold)
+
+	candidates = frappe.db.sql("""
+		SELECT t.term, COUNT(DISTINCT t.trigram) AS shared, st.trigram_count
+		FROM `tabDocument Search Trigram` t
+		JOIN `tabDocument Search Term` st ON st.name = t.term
+		WHERE t.trigram IN %s
+		AND st.trigram_count BETWEEN %s AND %s
+		AND st.document_frequency > 0
+		GROUP BY t.term, st.trigram_count
+		HAVING shared >= %s
+		ORDER BY shared DESC
+		LIMIT %s
+	""", (tuple(trigrams), min_count, max_count, min_shared, SEARCH_CONFIG['fuzzy_max_candidates']), as_dict=True)
+
+	similar = {}
+	for candidate in candidates:
+		similarity = candidate.shared / (len(trigrams) + candidate.trigram_count - candidate.shared)
+		if similarity >= threshold:
+			similar[candidate.term] = similarity
+
+	best = sorted(similar.items(), key=lambda item: item[1], reverse=True)
+	return dict(best[:SEARCH_CONFIG['fuzzy_max_expansions']])
\ No newline at end of file
@@ -0,0 +1,213 @@
+import frappe
+import math
+import re
+from collections import Counter
+
+from document_archiver.config import SEARCH_CONFIG
+
+# Inverted index over archive titles, tags, descriptions and page OCR text.
+# Each indexed document has one Document Search Posting per distinct term,
+# carrying a pre-computed BM25 term weight; Document Search Term keeps the
+# document frequency of every term for IDF at query time, and Document
+# Search Trigram maps the trigrams of every term for fuzzy lookups.
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+DOCUMENT_COUNT_KEY = "document_archiver:search:document_count"
+
+def tokenize(text):
+	"""Split text into lowercase index terms"""
+	if not text:
+		return []
+
+	min_length = SEARCH_CONFIG['min_term_length']
+	max_length = SEARCH_CONFIG['max_term_length']
+	return [term for term in TOKEN_PATTERN.findall(text.lower())
+			if min_length <= len(term) <= max_length]
+
+def build_term_weights(fields):
+	"""Combine (text, boost) pairs into one weight per term"""
+	k1 = SEARCH_CONFIG['bm25_k1']
+	weights = Counter()
+	for text, boost in fields:
+		for term, frequency in Counter(tokenize(text)).items():
+			weights[term] += boost * frequency * (k1 + 1) / (frequency + k1)
+	return weights
+
+def index_document(reference_doctype, reference_name, archive, fields):
+	"""Replace the postings of one document"""
+	weights = build_term_weights(fields)
+	filters = {"reference_doctype": reference_doctype, "reference_name": reference_name}
+
+	old_terms = set(frappe.get_all("Document Search Posting", filters=filters, pluck="term"))
+	frappe.db.delete("Document Search Posting", filters)
+
+	if weights:
+		now = frappe.utils.now()
+		frappe.db.bulk_insert(
+			"Document Search Posting",
+			fields=["name", "term", "reference_doctype", "reference_name", "archive", "weight",
+					"creation", "modified", "owner", "modified_by"],
+			values=[(frappe.generate_hash(length=12), term, reference_doctype, reference_name, archive, weight,
+					 now, now, "Administrator", "Administrator")
+					for term, weight in weights.items()]
+		)
+
+	add_document_frequencies(Counter(set(weights) - old_terms))
+	remove_document_frequencies(Counter(old_terms - set(weights)))
+
+def get_trigrams(term):
+	"""Padded character trigrams of a term"""
+	padded = f"  {term} "
+	return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+def add_document_frequencies(term_counts):
+	"""Increase document frequencies, creating terms seen for the first time"""
+	terms = list(term_counts.items())
+	now = frappe.utils.now()
+
+	for start in range(0, len(terms), 1000):
+		chunk = terms[start:start + 1000]
+		existing = set(frappe.get_all("Document Search Term",
+									  filters={"name": ["in", [term for term, count in chunk]]},
+									  pluck="name"))
+
+		values = ", ".join(["(%s, %s, %s, %s, %s, %s)"] * len(chunk))
+		params = []
+		for term, count in chunk:
+			params += [term, term, count, len(get_trigrams(term)), now, now]
+
+		frappe.db.sql(f"""
+			INSERT INTO `tabDocument Search Term` (name, term, document_frequency, trigram_count, creation, modified)
+			VALUES {values}
+			ON DUPLICATE KEY UPDATE document_frequency = document_frequency + VALUES(document_frequency)
+		""", params)
+
+		add_term_trigrams([term for term, count in chunk if term not in existing])
+
+def add_term_trigrams(terms):
+	"""Register the trigrams of new vocabulary terms"""
+	if not terms:
+		return
+
+	now = frappe.utils.now()
+	frappe.db.bulk_insert(
+		"Document Search Trigram",
+		fields=["name", "trigram", "term", "creation", "modified", "owner", "modified_by"],
+		values=[(frappe.generate_hash(length=12), trigram, term, now, now, "Administrator", "Administrator")
+				for term in terms for trigram in get_trigrams(term)]
+	)
+
+def remove_document_frequencies(term_counts):
+	"""Decrease document frequencies of terms no longer found in a document"""
+	for term, count in term_counts.items():
+		frappe.db.sql("""
+			UPDATE `tabDocument Search Term`
+			SET document_frequency = GREATEST(document_frequency - %s, 0)
+			WHERE name = %s
+		""", (count, term))
+
+def remove_document(reference_doctype, reference_name):
+	"""Drop a document from the index"""
+	index_document(reference_doctype, reference_name, None, [])
+
+def remove_archive(archive):
+	"""Drop an archive and all of its pages from the index"""
+	term_counts = frappe.db.sql("""
+		SELECT term, COUNT(*)
+		FROM `tabDocument Search Posting`
+		WHERE archive = %s
+		GROUP BY term
+	""", (archive,))
+
+	frappe.db.delete("Document Search Posting", {"archive": archive})
+	remove_document_frequencies(Counter(dict(term_counts)))
+
+def index_archive(archive):
+	"""Index the searchable fields of a Document Archive"""
+	boosts = SEARCH_CONFIG['field_boosts']
+	index_document("Document Archive", archive.name, archive.name, [
+		(archive.title, boosts['title']),
+		(archive.tags, boosts['tags']),
+		(archive.description, boosts['description']),
+	])
+
+def index_scanned_document(name):
+	"""Index the OCR text of a scanned page that belongs to an archive"""
+	row = frappe.db.get_value("Scanned Document", name, ["parent", "parenttype", "ocr_text"], as_dict=True)
+	if not row or row.parenttype != "Document Archive":
+		return
+
+	index_document("Scanned Document", name, row.parent,
+				   [(row.ocr_text, SEARCH_CONFIG['field_boosts']['ocr_text'])])
+
+def get_idf(terms):
+	"""Inverse document frequency of each term; terms never indexed are left out"""
+	frequencies = frappe.get_all("Document Search Term",
+								 filters={"name": ["in", terms], "document_frequency": [">", 0]},
+								 fields=["name", "document_frequency"])
+	total = get_document_count()
+
+	return {row.name: math.log(1 + (total - row.document_frequency + 0.5) / (row.document_frequency + 0.5))
+			for row in frequencies}
+
+def get_document_count():
+	"""Approximate number of indexed documents, refreshed hourly"""
+	count = frappe.cache().get_value(DOCUMENT_COUNT_KEY)
+	if count is None:
+		count = frappe.db.count("Document Archive") + frappe.db.count("Scanned Document")
+		frappe.cache().set_value(DOCUMENT_COUNT_KEY, count, expires_in_sec=3600)
+	return max(count, 1)
+
+def search(query, reference_doctype, limit=20, start=0):
+	"""Rank documents containing every query term; returns (results, has_more)"""
+	terms = list(dict.fromkeys(tokenize(query)))
+	if not terms:
+		return [], False
+
+	idf = get_idf(terms)
+	if len(idf) < len(terms):
+		# At least one term appears nowhere, so no document can match them all
+		return [], False
+
+	return rank_postings(idf, reference_doctype, limit, start, required_terms=len(terms))
+
+def rank_postings(term_weights, reference_doctype, limit, start, required_terms=1):
+	"""Score documents by summed posting weight x term weight"""
+	case = " ".join(["WHEN %s THEN %s"] * len(term_weights))
+	case_params = [value for item in term_weights.items() for value in item]
+
+	rows = frappe.db.sql(f"""
+		SELECT p.reference_name AS name, SUM(p.weight * CASE p.term {case} END) AS score
+		FROM `tabDocument Search Posting` p
+		JOIN `tabDocument Archive` da ON da.name = p.archive
+		WHERE p.term IN %s
+		AND p.reference_doctype = %s
+		AND da.status != 'Deleted'
+		GROUP BY p.reference_name
+		HAVING COUNT(*) >= %s
+		ORDER BY score DESC, name
+		LIMIT %s OFFSET %s
+	""", case_params + [tuple(term_weights), reference_doctype, required_terms, limit + 1, start], as_dict=True)
+
+	return rows[:limit], len(rows) > limit
+
+@frappe.whitelist()
+def rebuild_search_index():
+	"""Rebuild the whole search index in the background"""
+	frappe.only_for("System Manager")
+	frappe.enqueue("document_archiver.search.index.rebuild_search_index_job", queue="long", timeout=24 * 3600)
+	return {"status": "success", "message": "Search index rebuild queued"}
+
+def rebuild_search_index_job():
+	"""Background job: re-index every archive and scanned page"""
+	frappe.db.sql("DELETE FROM `tabDocument Search Posting`")
+	frappe.db.sql("DELETE FROM `tabDocument Search Term`")
+	frappe.db.sql("DELETE FROM `tabDocument Search Trigram`")
+	frappe.db.commit()
+
+	for archive in frappe.get_all("Document Archive", pluck="name"):
+		index_archive(frappe.get_doc("Document Archive", archive))
+		for name in frappe.get_all("Scanned Document", filters={"parent": archive}, pluck="name"):
+			index_scanned_document(name)
+		frappe.db.commit()
\ No newline at end of file
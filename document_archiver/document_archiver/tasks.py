@@ -0,0 +1,220 @@
+import frappe
+import re
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from document_archiver.api.response_cache import invalidate_archive
+from document_archiver.archive_pdf import append_archive_pages, load_page_layer, save_page_layer
+from document_archiver.config import PERFORMANCE_CONFIG
+from document_archiver.files import get_file_paths
+from document_archiver.ocr.cache import get_cache_key, get_cached_text, hash_file, set_cached_text
+from document_archiver.ocr.engine import warm_up_engines
+from document_archiver.ocr.extract import PIPELINE_VERSION, extract_page_with_stats, extract_text, get_ocr_settings, get_pipeline_settings, is_pdf
+from document_archiver.ocr.preprocess import new_stats
+from document_archiver.search.index import index_scanned_document
+
+def enqueue_ocr(scanned_document_names):
+	"""Queue OCR jobs for the given Scanned Document rows"""
+	names = list(dict.fromkeys(name for name in scanned_document_names if name))
+	batch_size = PERFORMANCE_CONFIG['ocr_batch_size']
+
+	for start in range(0, len(names), batch_size):
+		frappe.enqueue(
+			"document_archiver.tasks.process_ocr_batch",
+			queue=PERFORMANCE_CONFIG['ocr_queue'],
+			timeout=PERFORMANCE_CONFIG['ocr_job_timeout'],
+			enqueue_after_commit=True,
+			scanned_document_names=names[start:start + batch_size]
+		)
+
+def process_ocr_batch(scanned_document_names):
+	"""Background job: OCR a batch of pending Scanned Document rows"""
+	jobs = {}
+	rows = claim_pending_documents(scanned_document_names)
+	paths = get_file_paths([row.file_attachment for row in rows])
+	for row in rows:
+		try:
+			path = paths.get(row.file_attachment)
+			if not path:
+				raise frappe.DoesNotExistError(f"File {row.file_attachment} not found")
+			settings = get_ocr_settings(row.scan_quality)
+			content_hash = hash_file(path)
+			cache_key = get_cache_key(content_hash, get_pipeline_settings(settings))
+		except Exception as e:
+			frappe.log_error(f"Error resolving file for {row.name}: {str(e)}")
+			set_ocr_result(row.name, status="Failed")
+			continue
+
+		# Rows sharing the same file and settings are OCR'd once
+		if cache_key in jobs:
+			jobs[cache_key].names.append(row.name)
+			continue
+
+		text = get_cached_text(cache_key)
+		# An image page also needs its layer for the archive PDF, or it is OCR'd again
+		layer = load_page_layer(cache_key) if text is not None and not is_pdf(path) else None
+		if text is not None and (layer is not None or is_pdf(path)):
+			set_ocr_result(row.name, text=text, content_hash=content_hash)
+			if layer is not None:
+				append_archive_pages([row.name], layer)
+		else:
+			jobs[cache_key] = frappe._dict(names=[row.name], path=path, settings=settings, dpi=get_scan_dpi(row.resolution),
+										   cache_key=cache_key, content_hash=content_hash)
+
+	if not jobs:
+		return
+
+	if PERFORMANCE_CONFIG['parallel_processing']:
+		# Each worker loads its tesseract engines once and keeps them for the whole batch.
+		# PDFs fan out into pages; otherwise workers beyond the number of files would only warm up
+		languages = {job.settings['language']: job.settings for job in jobs.values()}
+		workers = PERFORMANCE_CONFIG['max_workers']
+		if not any(is_pdf(job.path) for job in jobs.values()):
+			workers = min(workers, len(jobs))
+		with ProcessPoolExecutor(max_workers=workers,
+								 initializer=warm_up_engines,
+								 initargs=(list(languages.values()),)) as executor:
+			run_ocr_jobs(list(jobs.values()), executor)
+	else:
+		run_ocr_jobs(list(jobs.values()))
+
+def run_ocr_jobs(jobs, executor=None):
+	"""OCR the given jobs, sharing one pool between images and PDF pages"""
+	pending = {}
+	if executor:
+		# Images are OCR'd whole by a pool worker; PDFs are split into pages below
+		for job in jobs:
+			if not is_pdf(job.path):
+				pending[executor.submit(extract_page_with_stats, job.path, job.settings, job.dpi)] = job
+
+	for job in jobs:
+		if executor and not is_pdf(job.path):
+			continue
+
+		try:
+			if is_pdf(job.path):
+				stats = new_stats()
+				save_ocr_text(job, extract_text(job.path, job.settings, executor, stats), stats)
+			else:
+				save_ocr_text(job, *extract_page_with_stats(job.path, job.settings, job.dpi))
+		except Exception as e:
+			save_ocr_failure(job, e)
+
+		for future in [future for future in pending if future.done()]:
+			save_ocr_result(pending.pop(future), future)
+
+	for future in as_completed(pending):
+		save_ocr_result(pending[future], future)
+
+def get_scan_dpi(resolution):
+	"""DPI from a row's resolution like "300 DPI", None for pixel sizes such as webcam frames"""
+	match = re.match(r"\s*(\d+)\s*DPI", resolution or "", re.IGNORECASE)
+	return int(match.group(1)) if match else None
+
+def claim_pending_documents(scanned_document_names):
+	"""Move Pending rows to Processing so that no other job picks them up"""
+	if not scanned_document_names:
+		return []
+
+	rows = frappe.db.sql("""
+		SELECT name, parent, parenttype, file_attachment, scan_quality, resolution
+		FROM `tabScanned Document`
+		WHERE name IN %(names)s
+		AND processing_status = 'Pending'
+		FOR UPDATE
+	""", {"names": tuple(scanned_document_names)}, as_dict=True)
+
+	if rows:
+		frappe.db.sql("""
+			UPDATE `tabScanned Document`
+			SET processing_status = 'Processing', modified = %(now)s
+			WHERE name IN %(names)s
+		""", {"names": tuple(row.name for row in rows), "now": frappe.utils.now()})
+	frappe.db.commit()
+
+	for archive in {row.parent for row in rows if row.parenttype == "Document Archive"}:
+		invalidate_archive(archive, lists=False)
+	return rows
+
+def save_ocr_result(job, future):
+	"""Store the outcome of a pooled OCR job"""
+	try:
+		text, stats, layer = future.result()
+	except Exception as e:
+		save_ocr_failure(job, e)
+	else:
+		save_ocr_text(job, text, stats, layer)
+
+def save_ocr_text(job, text, stats, layer=None):
+	"""Store OCR text on the job's rows and in the OCR cache, and add image pages to archive PDFs"""
+	for name in job.names:
+		set_ocr_result(name, text=text, content_hash=job.content_hash)
+	set_cached_text(job.cache_key, text)
+	if layer is not None:
+		save_page_layer(job.cache_key, layer)
+		append_archive_pages(job.names, layer)
+	log_preprocess_stats(job, stats)
+
+def log_preprocess_stats(job, stats):
+	"""Record per-stage preprocessing time, denoise and geometry decisions"""
+	frappe.logger("document_archiver").info({
+		"event": "ocr_preprocess",
+		"scanned_documents": job.names,
+		"pages": stats["pages"],
+		"timings_ms": {stage: round(ms, 1) for stage, ms in stats["timings"].items()},
+		"denoise": dict(stats["denoise"]),
+		"geometry": dict(stats["geometry"]),
+	})
+
+def save_ocr_failure(job, error):
+	"""Log an OCR error and mark the job's rows as Failed"""
+	frappe.log_error(f"Error in OCR processing for {', '.join(job.names)}: {str(error)}")
+	for name in job.names:
+		set_ocr_result(name, status="Failed", content_hash=job.content_hash)
+
+def set_ocr_result(name, text=None, status="Completed", content_hash=None):
+	"""Write OCR text and status without re-running document hooks"""
+	# Stamping failures too keeps archive saves from retrying them; reprocess explicitly
+	values = {"processing_status": status, "processed_version": PIPELINE_VERSION}
+	if content_hash:
+		values["content_hash"] = content_hash
+	if text is not None:
+		values["ocr_text"] = text
+
+	frappe.db.set_value("Scanned Document", name, values)
+	if text is not None:
+		index_scanned_document(name)
+	frappe.db.commit()
+
+	# db.set_value bypasses doc_events, so drop the cached archive details here
+	row = frappe.db.get_value("Scanned Document", name, ["parent", "parenttype"], as_dict=True)
+	if row and row.parenttype == "Document Archive":
+		invalidate_archive(row.parent, lists=False)
+
+def enqueue_stale_ocr_jobs():
+	"""Scheduler: re-queue OCR work that was never picked up or was interrupted"""
+	stale_after = frappe.utils.add_to_date(frappe.utils.now_datetime(), minutes=-10)
+	interrupted_after = frappe.utils.add_to_date(frappe.utils.now_datetime(),
+												 seconds=-PERFORMANCE_CONFIG['ocr_job_timeout'])
+
+	frappe.db.sql("""
+		UPDATE `tabScanned Document`
+		SET processing_status = 'Pending'
+		WHERE processing_status = 'Processing'
+		AND modified < %s
+	""", (interrupted_after,))
+
+	names = frappe.get_all("Scanned Document",
+						   filters={"processing_status": "Pending", "modified": ["<", stale_after]},
+						   pluck="name")
+	if not names:
+		return
+
+	# Stamp the rows so later ticks leave them alone until this attempt is stale too
+	frappe.db.sql("""
+		UPDATE `tabScanned Document`
+		SET modified = %(now)s
+		WHERE name IN %(names)s
+	""", {"names": tuple(names), "now": frappe.utils.now()})
+	enqueue_ocr(names)
+	# The jobs are sent on commit
+	frappe.db.commit()
\ No newline at end of file
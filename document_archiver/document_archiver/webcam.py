@@ -0,0 +1,127 @@
+import cv2
+import frappe
+import threading
+import time
+from collections import deque
+
+from document_archiver.config import SCANNER_CONFIG
+
+# Long-lived webcam capture. Opening a camera and waiting for auto exposure
+# costs 0.5-2 s, so each worker process keeps one session per device open
+# while it is in use: a reader thread fills a small ring buffer with recent
+# frames, and a capture picks the sharpest of them. The device is released
+# after SCANNER_CONFIG['webcam']['idle_release'] seconds without captures.
+#
+# Sessions live in a web worker, while health probes and device discovery
+# run in background workers that cannot see them. Every capture therefore
+# also sets a shared cache flag that expires with the session's idle
+# release, and probes trust the flag instead of opening a held camera.
+
+SESSION_KEY = "document_archiver:webcam_session"
+
+# Longest side of the thumbnail the focus metric is computed on
+FOCUS_SAMPLE_SIZE = 320
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+def sharpness(frame):
+	"""Focus metric: variance of the Laplacian of a small grayscale thumbnail"""
+	scale = FOCUS_SAMPLE_SIZE / max(frame.shape[:2])
+	small = cv2.resize(frame, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA) if scale < 1 else frame
+	gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY) if small.ndim == 3 else small
+	return cv2.Laplacian(gray, cv2.CV_32F).var()
+
+class CaptureSession:
+	"""An open camera with a reader thread keeping the latest frames"""
+
+	def __init__(self, device_index):
+		settings = SCANNER_CONFIG['webcam']
+		self.device_index = device_index
+		self.capture = cv2.VideoCapture(device_index)
+		if not self.capture.isOpened():
+			self.capture.release()
+			raise RuntimeError("Webcam not accessible")
+
+		self.frames = deque(maxlen=settings['buffer_frames'])
+		self.frame_ready = threading.Condition()
+		self.last_used = time.monotonic()
+		self.running = True
+		self.thread = threading.Thread(target=self.read_frames, daemon=True)
+		self.thread.start()
+
+	def read_frames(self):
+		"""Reader thread: drop warm-up frames, then keep the ring buffer filled"""
+		settings = SCANNER_CONFIG['webcam']
+		skipped = 0
+		try:
+			while self.running:
+				ok, frame = self.capture.read()
+				if not ok:
+					time.sleep(0.05)
+					continue
+				if skipped < settings['warmup_frames']:
+					skipped += 1
+					continue
+
+				with self.frame_ready:
+					self.frames.append(frame)
+					self.frame_ready.notify_all()
+
+				if time.monotonic() - self.last_used > settings['idle_release']:
+					self.running = False
+		finally:
+			self.capture.release()
+
+	def best_frame(self):
+		"""Sharpest buffered frame, waiting for frames if the session just started"""
+		self.last_used = time.monotonic()
+		settings = SCANNER_CONFIG['webcam']
+
+		# Half a buffer of fresh frames is enough to choose from and keeps
+		# back-to-back captures close to the camera frame rate
+		min_frames = max(1, self.frames.maxlen // 2)
+
+		with self.frame_ready:
+			self.frame_ready.wait_for(lambda: len(self.frames) >= min_frames or not self.running,
+									  timeout=settings['capture_timeout'])
+			frames = list(self.frames)
+			# Later captures only consider frames taken after this one, i.e. of the next page
+			self.frames.clear()
+
+		if not frames:
+			raise RuntimeError("Failed to capture image")
+		return max(frames, key=sharpness)
+
+	def close(self):
+		"""Stop the reader thread, which releases the device"""
+		self.running = False
+
+def get_session(device_index=0):
+	"""The open capture session for a device, starting one if needed"""
+	with _sessions_lock:
+		session = _sessions.get(device_index)
+		if session is None or not session.running:
+			session = _sessions[device_index] = CaptureSession(device_index)
+		return session
+
+def get_active_session(device_index=0):
+	"""The running session for a device, or None without opening the camera"""
+	session = _sessions.get(device_index)
+	return session if session and session.running else None
+
+def get_session_key(device_index):
+	"""Cache key of the shared flag for a device's open session"""
+	return f"{SESSION_KEY}:{device_index}"
+
+def is_session_open(device_index=0):
+	"""Whether this or any other process holds a capture session on the device"""
+	return bool(get_active_session(device_index) or frappe.cache().get_value(get_session_key(device_index)))
+
+def capture_best_frame(device_index=0):
+	"""Capture the sharpest recent frame from a webcam"""
+	session = get_session(device_index)
+	# Lasts as long as the session stays open without further captures
+	frappe.cache().set_value(get_session_key(device_index), 1,
+							 expires_in_sec=SCANNER_CONFIG['webcam']['idle_release'])
+	return session.best_frame()
\ No newline at end of file